@@ -1,53 +1,866 @@
-from openvino.runtime import Core
-from openvino.runtime import Layout, set_batch
+'''
+Benchmark the detectron2 Mask R-CNN IR produced by setup_detectron2.sh with OpenVINO.
+
+Usage:
+# Single-stream latency (synchronous infer calls, one at a time)
+python ov-infer.py
+
+# Multi-stream throughput with AsyncInferQueue: try several NUM_STREAMS / infer request
+# counts under PERFORMANCE_HINT=THROUGHPUT and pick the best pair
+python ov-infer.py --mode throughput
+python ov-infer.py --mode throughput --nstreams 1 2 4 8 --nireq-per-stream 1 2 -t 10
+
+# Mixed image heights: compile one model per height bucket on demand (LRU, CACHE_DIR
+# persisted), pad each image to the smallest bucket that fits and compare with padding
+# everything to the largest bucket
+python ov-infer.py --mode buckets --num-images 200 --max-compiled 3 --compare-max
+
+# Real images end to end: decode -> resize -> pad -> NCHW float32 in a bounded thread pool,
+# written into preallocated buffers that are shared with OpenVINO (no copy into the request)
+python ov-infer.py --mode pipeline --images ./datasets/coco/val2017 --workers 4 --nireq 2 -t 20
+
+# Startup cost for autoscaled replicas: time read / reshape / compile and the first inference
+# in fresh processes for cold compile (with and without ENABLE_MMAP), a warm CACHE_DIR and
+# import_model of a blob written by export_model
+python ov-infer.py --mode startup --runs 5
+
+# INT8: quantize the IR with NNCF post-training quantization (calibrating on --images, or on
+# synthetic inputs without it), write model_int8.xml next to model.xml and compare both
+python ov-infer.py --mode int8 --images ./datasets/coco/val2017 --calib-samples 300
+
+# Deployment config sweep over batch, INFERENCE_PRECISION_HINT, INFERENCE_NUM_THREADS and input
+# height (and NUM_STREAMS for the AsyncInferQueue throughput), one JSON line per point (rerun the
+# same command to resume), then the Pareto frontier of latency vs. throughput
+python ov-infer.py --mode sweep --precision f32 bf16 --threads 0 4 8 --heights 640 736 800 --sweep-nstreams 1 2 4 AUTO -t 5
+'''
+
+from openvino.runtime import Core, AsyncInferQueue, Tensor
+from openvino.runtime import Layout, set_batch, serialize
 import numpy as np
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
 import time
+import glob
+import itertools
+import queue
+import threading
+from collections import OrderedDict
 
-ir_path="./rp-output/IR/model.xml"
-ie = Core()
-model = ie.read_model(ir_path)
-
-# Update batch size
-# model.get_parameters()[0].set_layout(Layout("N..."))
-# set_batch(model,1)
+IR_PATH = "./rp-output/IR/model.xml"
 
-# Update shape
 # The default input shape is [C,H,W] [3,800,1202]
 # The H can be one of these values (640, 672, 704, 736, 768, 800) Refer: https://github.com/facebookresearch/detectron2/blob/main/configs/Base-RCNN-FPN.yaml#L41
+INPUT_SHAPE = [3, 736, 1200]
+HEIGHT_BUCKETS = [640, 672, 704, 736, 768, 800]
+
+def load_model(ie, ir_path, input_shape):
+    model = ie.read_model(ir_path)
+
+    # Update batch size
+    # model.get_parameters()[0].set_layout(Layout("N..."))
+    # set_batch(model,1)
+
+    # Update shape
+    model.reshape(input_shape)
+    return model
+
+def benchmark_latency(ie, model, input_shape, bench_time=5, device="CPU"):
+    # Compile the model
+    compiled_model = ie.compile_model(model=model, device_name=device)
+
+    # get the names of input and output layers of the model
+    input_layer = compiled_model.input(0)
+    output_layer = compiled_model.output(0)
+
+    dummy_input = np.random.randn(*tuple(input_shape))
+
+    latency_arr = []
+    end = time.time() + bench_time
+
+    print(f"\nBenchmarking OpenVINO inference for {bench_time}sec...")
+    print(f"Input shape: {dummy_input.shape}")
+
+    while time.time() < end:
+        start_time = time.time()
+        ov_result = compiled_model([dummy_input])
+        latency = time.time() - start_time
+        latency_arr.append(latency)
+
+    # Save the result for accuracy verificaiton
+    print(f"Output shapes:")
+    for out_nm in compiled_model.outputs:
+        print(f"{ov_result[out_nm].shape}")
+
+    avg_latency = np.array(latency_arr).mean()
+    fps = 1 / avg_latency
+
+    print(f"\nAvg Latency: {avg_latency:.4f} sec, FPS: {fps:.2f}\n")
+    return avg_latency, fps
+
+def run_async(compiled_model, nireq, inputs, bench_time):
+    """Keep `nireq` infer requests busy for `bench_time` seconds; return (FPS, latencies in sec)."""
+    infer_queue = AsyncInferQueue(compiled_model, nireq)
+    latencies = []
+
+    def callback(request, start_time):
+        latencies.append(time.perf_counter() - start_time)
+
+    infer_queue.set_callback(callback)
+
+    # One warm-up pass per request so first-inference costs are not counted
+    for _ in range(nireq):
+        infer_queue.start_async(inputs, time.perf_counter())
+    infer_queue.wait_all()
+    latencies.clear()
+
+    start = time.perf_counter()
+    end = start + bench_time
+    while time.perf_counter() < end:
+        # start_async blocks until one of the requests is idle
+        infer_queue.start_async(inputs, time.perf_counter())
+    infer_queue.wait_all()
+    elapsed = time.perf_counter() - start
+
+    return len(latencies) / elapsed, latencies
+
+def benchmark_throughput(ie, model, input_shape, bench_time=5, device="CPU", nstreams_list=None, nireq_per_stream=(1, 2)):
+    """Measure FPS and latency for each NUM_STREAMS / infer request pair and report the best one."""
+    if not nstreams_list:
+        # 1, 2, 4, ... up to the number of cores, plus what the THROUGHPUT hint picks by itself
+        num_cpus = os.cpu_count()
+        nstreams_list = [1]
+        while nstreams_list[-1] * 2 <= num_cpus:
+            nstreams_list.append(nstreams_list[-1] * 2)
+        nstreams_list.append("AUTO")
+
+    inputs = {0: np.random.randn(*tuple(input_shape)).astype(np.float32)}
+
+    print(f"\nBenchmarking OpenVINO throughput for {bench_time}sec per config...")
+    print(f"Input shape: {inputs[0].shape}")
+
+    results = []
+    for nstreams in nstreams_list:
+        config = {"PERFORMANCE_HINT": "THROUGHPUT"}
+        if nstreams != "AUTO":
+            config["NUM_STREAMS"] = str(nstreams)
+        compiled_model = ie.compile_model(model=model, device_name=device, config=config)
+        actual_streams = compiled_model.get_property("NUM_STREAMS")
+        optimal_nireq = compiled_model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS")
+
+        nireq_list = [optimal_nireq] if nstreams == "AUTO" else [int(actual_streams) * m for m in nireq_per_stream]
+        for nireq in nireq_list:
+            fps, latencies = run_async(compiled_model, nireq, inputs, bench_time)
+            lat_ms = np.array(latencies) * 1000
+            result = {
+                "nstreams": f"AUTO({actual_streams})" if nstreams == "AUTO" else str(actual_streams),
+                "nireq": nireq,
+                "fps": fps,
+                "latency_median_ms": float(np.median(lat_ms)),
+                "latency_p90_ms": float(np.percentile(lat_ms, 90)),
+            }
+            results.append(result)
+            print(f"NUM_STREAMS: {result['nstreams']:>8}, nireq: {nireq:>3}, FPS: {fps:>8.2f}, "
+                  f"Latency median: {result['latency_median_ms']:.2f} ms, p90: {result['latency_p90_ms']:.2f} ms")
+        del compiled_model
+
+    best = max(results, key=lambda r: r["fps"])
+    print(f"\nBest: NUM_STREAMS={best['nstreams']}, nireq={best['nireq']} -> FPS: {best['fps']:.2f}, "
+          f"Latency median: {best['latency_median_ms']:.2f} ms\n")
+    return best
+
+class BucketedModel:
+    """Compiles one model per input height bucket on first use and keeps at most `max_compiled` (LRU).
+
+    Each image is zero-padded at the bottom/right (as detectron2 does) to the smallest
+    bucket that fits, in a buffer that is reused for every image of that bucket.
+    """
+
+    def __init__(self, ie, ir_path, width, buckets=HEIGHT_BUCKETS, device="CPU", max_compiled=3, cache_dir=None):
+        self.ie = ie
+        self.ir_path = ir_path
+        self.width = width
+        self.buckets = sorted(buckets)
+        self.device = device
+        self.max_compiled = max_compiled
+        self.config = {"CACHE_DIR": cache_dir} if cache_dir else {}
+        self.compiled = OrderedDict()
+        self.buffers = {}
+        self.stats = {"compiles": 0, "compile_time": 0.0, "evictions": 0, "hits": 0}
+
+    def bucket_for(self, height):
+        for bucket in self.buckets:
+            if bucket >= height:
+                return bucket
+        raise ValueError(f"Image height {height} is larger than the largest bucket {self.buckets[-1]}")
+
+    def get(self, bucket):
+        if bucket in self.compiled:
+            self.compiled.move_to_end(bucket)
+            self.stats["hits"] += 1
+            return self.compiled[bucket]
+
+        # Evict before compiling, so no more than max_compiled models are ever held at once
+        while len(self.compiled) >= self.max_compiled:
+            evicted, _ = self.compiled.popitem(last=False)
+            self.buffers.pop(evicted, None)
+            self.stats["evictions"] += 1
+
+        start_time = time.perf_counter()
+        model = load_model(self.ie, self.ir_path, [3, bucket, self.width])
+        self.compiled[bucket] = self.ie.compile_model(model=model, device_name=self.device, config=self.config)
+        self.stats["compile_time"] += time.perf_counter() - start_time
+        self.stats["compiles"] += 1
+        return self.compiled[bucket]
+
+    def pad(self, image, bucket):
+        c, h, w = image.shape
+        if w > self.width:
+            raise ValueError(f"Image width {w} is larger than the model width {self.width}")
+        buffer = self.buffers.get(bucket)
+        if buffer is None:
+            buffer = self.buffers[bucket] = np.zeros((c, bucket, self.width), dtype=np.float32)
+        buffer[:, :h, :w] = image
+        buffer[:, h:, :] = 0
+        buffer[:, :h, w:] = 0
+        return buffer
+
+    def infer(self, image):
+        """Run one [C,H,W] image; return (result, bucket height)."""
+        bucket = self.bucket_for(image.shape[1])
+        compiled_model = self.get(bucket)
+        return compiled_model([self.pad(image, bucket)]), bucket
+
+def benchmark_buckets(ie, ir_path, input_shape, device="CPU", num_images=100, max_compiled=3,
+                      cache_dir=None, compare_max=False, seed=0):
+    """Run a stream of mixed-height images through BucketedModel and report the compute saved."""
+    c, _, width = input_shape
+    rng = np.random.default_rng(seed)
+    heights = rng.integers(HEIGHT_BUCKETS[0] - 40, HEIGHT_BUCKETS[-1] + 1, size=num_images)
+    # Views into one max-size image, so the stream does not need gigabytes of inputs
+    base_image = rng.standard_normal((c, HEIGHT_BUCKETS[-1], width), dtype=np.float32)
+    images = [base_image[:, :h, :] for h in heights]
+
+    print(f"\nBenchmarking height buckets {HEIGHT_BUCKETS} on {num_images} images "
+          f"(H {heights.min()}-{heights.max()}, W {width}), at most {max_compiled} compiled models")
+    if cache_dir:
+        print(f"CACHE_DIR: {cache_dir}")
+
+    runner = BucketedModel(ie, ir_path, width, HEIGHT_BUCKETS, device, max_compiled, cache_dir)
+    counts = {}
+    start_time = time.perf_counter()
+    for image in images:
+        _, bucket = runner.infer(image)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    bucket_time = time.perf_counter() - start_time
+
+    print("\nImages per bucket:")
+    for bucket in sorted(counts):
+        print(f"  H {bucket}: {counts[bucket]}")
+    print(f"Compiles: {runner.stats['compiles']} ({runner.stats['compile_time']:.2f} sec), "
+          f"cache hits: {runner.stats['hits']}, evictions: {runner.stats['evictions']}")
+    infer_time = bucket_time - runner.stats["compile_time"]
+    print(f"Bucketed: total {bucket_time:.2f} sec, inference {infer_time:.2f} sec, "
+          f"FPS (excluding compiles): {num_images / infer_time:.2f}")
+
+    # Inference cost scales with the padded pixel area
+    bucket_area = sum(runner.bucket_for(h) for h in heights)
+    max_area = HEIGHT_BUCKETS[-1] * num_images
+    print(f"Padded pixels vs. a single H {HEIGHT_BUCKETS[-1]} model: {bucket_area / max_area * 100:.1f}% "
+          f"(estimated compute saved: {(1 - bucket_area / max_area) * 100:.1f}%)")
+
+    if compare_max:
+        max_runner = BucketedModel(ie, ir_path, width, [HEIGHT_BUCKETS[-1]], device, 1, cache_dir)
+        max_runner.get(HEIGHT_BUCKETS[-1])
+        start_time = time.perf_counter()
+        for image in images:
+            max_runner.infer(image)
+        max_time = time.perf_counter() - start_time
+        print(f"Single H {HEIGHT_BUCKETS[-1]} model: inference {max_time:.2f} sec, FPS: {num_images / max_time:.2f}")
+        print(f"Measured compute saved: {(1 - infer_time / max_time) * 100:.1f}%\n")
+
+def list_images(image_dir):
+    paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp") for p in glob.glob(os.path.join(image_dir, f"*.{ext}")))
+    if not paths:
+        raise SystemExit(f"No images found in {image_dir}")
+    return paths
+
+def preprocess_into(cv2, path, out):
+    """Decode `path`, resize it to fit `out` keeping the aspect ratio, and write it as CHW float32 into `out`.
+
+    The exported detectron2 model normalizes internally, so it takes raw BGR pixel values.
+    """
+    _, height, width = out.shape
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot decode {path}")
+    h, w = image.shape[:2]
+    scale = min(height / h, width / w)
+    nh, nw = min(height, int(round(h * scale))), min(width, int(round(w * scale)))
+    resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    # HWC uint8 -> CHW float32, converted while assigning into the shared buffer
+    out[:, :nh, :nw] = resized.transpose(2, 0, 1)
+    out[:, nh:, :] = 0
+    out[:, :nh, nw:] = 0
+
+def benchmark_pipeline(ie, model, input_shape, image_dir, bench_time=5, device="CPU", workers=4, nireq=2):
+    """Benchmark decode + preprocessing + inference end to end and report which side is the bottleneck.
+
+    `workers` threads preprocess into a fixed set of preallocated float32 buffers. Each
+    buffer is wrapped once in a shared-memory ov.Tensor, so starting an infer request
+    only points it at the buffer. A buffer goes back to the workers when its inference
+    completes.
+    """
+    import cv2
+    # OpenVINO owns the cores for inference; keep each preprocessing worker on one thread
+    cv2.setNumThreads(1)
+
+    paths = list_images(image_dir)
+
+    config = {"PERFORMANCE_HINT": "THROUGHPUT"} if nireq > 1 else {}
+    compiled_model = ie.compile_model(model=model, device_name=device, config=config)
+
+    num_buffers = nireq + workers
+    buffers = [np.zeros(tuple(input_shape), dtype=np.float32) for _ in range(num_buffers)]
+    tensors = [Tensor(buffer, shared_memory=True) for buffer in buffers]
+    free_buffers = queue.Queue()
+    for i in range(num_buffers):
+        free_buffers.put(i)
+    ready = queue.Queue()
+    stop = threading.Event()
+    next_image = itertools.count()
+    lock = threading.Lock()
+    stats = {"preprocess_time": 0.0, "preprocessed": 0, "worker_wait": 0.0}
+    bad_paths = set()
+    latencies = []
+
+    def worker():
+        while not stop.is_set():
+            if len(bad_paths) == len(paths):
+                return
+            wait_start = time.perf_counter()
+            try:
+                idx = free_buffers.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            path = paths[next(next_image) % len(paths)]
+            if path in bad_paths:
+                free_buffers.put(idx)
+                continue
+            start = time.perf_counter()
+            try:
+                preprocess_into(cv2, path, buffers[idx])
+            except Exception as e:
+                # Skip the file from now on; the buffer goes back so no worker is starved
+                with lock:
+                    if path not in bad_paths:
+                        print(f"Skipping {path}: {e}")
+                    bad_paths.add(path)
+                free_buffers.put(idx)
+                continue
+            done = time.perf_counter()
+            with lock:
+                stats["worker_wait"] += start - wait_start
+                stats["preprocess_time"] += done - start
+                stats["preprocessed"] += 1
+            ready.put((idx, start))
+
+    def callback(request, userdata):
+        idx, start = userdata
+        latencies.append(time.perf_counter() - start)
+        free_buffers.put(idx)
+
+    infer_queue = AsyncInferQueue(compiled_model, nireq)
+    infer_queue.set_callback(callback)
+
+    # Warm-up inference so the first-inference cost is not counted
+    compiled_model([buffers[0]])
+
+    print(f"\nBenchmarking image pipeline for {bench_time}sec: {len(paths)} images from {image_dir}")
+    print(f"Workers: {workers}, infer requests: {nireq}, shared buffers: {num_buffers}, input shape: {input_shape}")
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    infer_wait = 0.0
+    completed = 0
+    start_time = time.perf_counter()
+    end = start_time + bench_time
+    while time.perf_counter() < end:
+        wait_start = time.perf_counter()
+        try:
+            idx, start = ready.get(timeout=0.5)
+        except queue.Empty:
+            infer_wait += time.perf_counter() - wait_start
+            if not any(t.is_alive() for t in threads):
+                print("All preprocessing workers stopped")
+                break
+            continue
+        infer_wait += time.perf_counter() - wait_start
+        # start_async blocks while all infer requests are busy
+        infer_queue.start_async({0: tensors[idx]}, (idx, start))
+        completed += 1
+    infer_queue.wait_all()
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    for t in threads:
+        t.join()
+
+    if not completed:
+        raise SystemExit(f"None of the {len(paths)} images in {image_dir} could be preprocessed")
+    if bad_paths:
+        print(f"\nSkipped {len(bad_paths)} of {len(paths)} images that could not be decoded")
+
+    lat_ms = np.array(latencies) * 1000
+    preprocess_ms = stats["preprocess_time"] / max(stats["preprocessed"], 1) * 1000
+    # Fraction of the run in which inference sat idle waiting for images, and in which
+    # the workers sat idle waiting for a free buffer (i.e. for inference)
+    infer_starved = infer_wait / elapsed * 100
+    workers_blocked = stats["worker_wait"] / (elapsed * workers) * 100
+
+    print(f"\nEnd-to-end: {completed / elapsed:.2f} images/sec, latency median {np.median(lat_ms):.2f} ms, "
+          f"p90 {np.percentile(lat_ms, 90):.2f} ms")
+    print(f"Preprocessing: {preprocess_ms:.2f} ms/image per worker, "
+          f"capacity {workers / preprocess_ms * 1000:.2f} images/sec with {workers} workers")
+    print(f"Inference waiting for images: {infer_starved:.1f}% of the time")
+    print(f"Workers waiting for free buffers: {workers_blocked:.1f}% of the time")
+    if infer_starved > workers_blocked:
+        print("Bottleneck: preprocessing (add --workers or make decode/resize cheaper)\n")
+    else:
+        print("Bottleneck: inference (tune --nireq / NUM_STREAMS or the model)\n")
+
+def calibration_source(input_shape, image_dir=None, num_samples=300, seed=0):
+    """Calibration items and the transform that turns one item into a model input.
+
+    Inputs are made one at a time when NNCF asks for them, so at most a few of them
+    (about 10 MB each at the default shape) are in memory at once. Items are image paths
+    from `image_dir`, or sample indices for random inputs when no folder is given.
+    """
+    shape = tuple(input_shape)
+    if image_dir:
+        import cv2
+
+        def load_image(path):
+            sample = np.empty(shape, dtype=np.float32)
+            preprocess_into(cv2, path, sample)
+            return sample
+        return list_images(image_dir)[:num_samples], load_image
+
+    def random_input(index):
+        # Seeded per index, so every pass over the dataset sees the same inputs.
+        # Raw BGR pixel range, like the real inputs; activation ranges from this are only a rough guess
+        return np.random.default_rng((seed, index)).uniform(0, 255, size=shape).astype(np.float32)
+    return range(num_samples), random_input
+
+def quantize_model(ie, ir_path, input_shape, int8_path, image_dir=None, num_samples=300):
+    """Quantize the IR to INT8 with NNCF post-training quantization and serialize it to `int8_path`."""
+    import nncf
+
+    model = load_model(ie, ir_path, input_shape)
+    items, transform = calibration_source(input_shape, image_dir, num_samples)
+    if image_dir:
+        print(f"Calibrating on {len(items)} images from {image_dir}")
+    else:
+        print(f"Calibrating on {len(items)} synthetic inputs (pass --images for real calibration data)")
+    # The exported model takes a single CHW image, so one transformed item is one input
+    dataset = nncf.Dataset(items, transform)
+
+    start_time = time.perf_counter()
+    quantized = nncf.quantize(model, dataset, subset_size=len(items))
+    print(f"Quantization took {time.perf_counter() - start_time:.1f} sec")
+    serialize(quantized, int8_path)
+    print(f"INT8 IR written to {int8_path}")
+    return quantized
+
+def first_output(ie, model, inputs, device="CPU"):
+    compiled_model = ie.compile_model(model=model, device_name=device)
+    return compiled_model([inputs])[compiled_model.output(0)]
+
+def benchmark_int8(ie, ir_path, input_shape, bench_time=5, device="CPU", image_dir=None, num_samples=300,
+                   int8_path=None):
+    """Quantize the FP32 IR (or reuse an existing INT8 IR) and compare speed and the first output."""
+    if int8_path is None:
+        root, ext = os.path.splitext(ir_path)
+        int8_path = f"{root}_int8{ext}"
+
+    fp32_model = load_model(ie, ir_path, input_shape)
+    if os.path.exists(int8_path):
+        print(f"Using existing INT8 IR {int8_path} (delete it to quantize again)")
+        int8_model = load_model(ie, int8_path, input_shape)
+    else:
+        int8_model = quantize_model(ie, ir_path, input_shape, int8_path, image_dir, num_samples)
+
+    print("\n== FP32 ==")
+    fp32_latency, fp32_fps = benchmark_latency(ie, fp32_model, input_shape, bench_time, device)
+    print("== INT8 ==")
+    int8_latency, int8_fps = benchmark_latency(ie, int8_model, input_shape, bench_time, device)
+
+    # Compare on a real image if there is one; random noise gives few detections to compare
+    items, transform = calibration_source(input_shape, image_dir, 1)
+    inputs = transform(items[0])
+    fp32_out = first_output(ie, fp32_model, inputs, device)
+    int8_out = first_output(ie, int8_model, inputs, device)
+    print(f"\nFirst output: FP32 {fp32_out.shape}, INT8 {int8_out.shape}")
+    if fp32_out.shape != int8_out.shape:
+        # Detection outputs have one row per detection, which quantization can change
+        print("Shapes differ (different number of detections); comparing the common rows")
+        common = tuple(slice(0, min(a, b)) for a, b in zip(fp32_out.shape, int8_out.shape))
+        fp32_out, int8_out = fp32_out[common], int8_out[common]
+    if fp32_out.size:
+        diff = np.abs(fp32_out.astype(np.float32) - int8_out.astype(np.float32))
+        scale = np.abs(fp32_out).max() or 1.0
+        print(f"Abs diff: max {diff.max():.4f}, mean {diff.mean():.4f} (max relative to FP32 range: "
+              f"{diff.max() / scale * 100:.2f}%)")
+
+    print(f"\n{'Precision':<10}{'Latency ms':>12}{'FPS':>10}")
+    print(f"{'FP32':<10}{fp32_latency * 1000:>12.2f}{fp32_fps:>10.2f}")
+    print(f"{'INT8':<10}{int8_latency * 1000:>12.2f}{int8_fps:>10.2f}")
+    print(f"INT8 speedup: {int8_fps / fp32_fps:.2f}x\n")
+
+def load_sweep_model(ie, ir_path, input_shape, batch, height):
+    """Read the IR and give it input height `height` and batch size `batch`."""
+    c, _, w = input_shape
+    model = ie.read_model(ir_path)
+    param = model.get_parameters()[0]
+    if param.get_partial_shape().rank.get_length() == 4:
+        model.reshape([1, c, height, w])
+        param.set_layout(Layout("N..."))
+        set_batch(model, batch)
+    elif batch == 1:
+        model.reshape([c, height, w])
+    else:
+        # The detectron2 export takes one CHW image per call
+        raise ValueError("model input has no batch dimension")
+    return model
+
+def pareto_frontier(points):
+    """Points not beaten by any other point on both latency (lower) and throughput (higher)."""
+    frontier = []
+    for point in sorted(points, key=lambda p: (p["latency_median_ms"], -p["fps"])):
+        if not frontier or point["fps"] > frontier[-1]["fps"]:
+            frontier.append(point)
+    return frontier
+
+def effective_precision(compiled_model):
+    """INFERENCE_PRECISION_HINT the compiled model actually runs with, e.g. 'f32' when bf16 is not supported."""
+    value = compiled_model.get_property("INFERENCE_PRECISION_HINT")
+    return value.get_type_name() if hasattr(value, "get_type_name") else str(value)
+
+def measure_sync_latency(compiled_model, inputs, bench_time):
+    """Latencies in sec of back-to-back synchronous calls for `bench_time` seconds."""
+    compiled_model([inputs])  # first inference is not counted
+    latencies = []
+    end = time.perf_counter() + bench_time
+    while time.perf_counter() < end:
+        infer_start = time.perf_counter()
+        compiled_model([inputs])
+        latencies.append(time.perf_counter() - infer_start)
+    return latencies
+
+def benchmark_sweep(ie, ir_path, input_shape, bench_time=5, device="CPU", batches=(1,), precisions=("f32", "bf16"),
+                    threads_list=(0,), heights=None, nstreams_list=("AUTO",), output="./rp-output/sweep.jsonl"):
+    """Measure every batch / precision / thread count / height / NUM_STREAMS combination, one JSON line per point.
+
+    Throughput and its request latency come from the AsyncInferQueue harness (run_async)
+    under PERFORMANCE_HINT=THROUGHPUT with the given NUM_STREAMS; the single-request
+    latency under PERFORMANCE_HINT=LATENCY is recorded next to it, measured once per
+    batch / precision / threads / height. Points already in `output` are not measured
+    again, so an interrupted sweep resumes where it stopped. Threads 0 leaves
+    INFERENCE_NUM_THREADS to the plugin. The precision the compiled model reports is stored as
+    effective_precision; points where it differs from the hint are recorded as skipped.
+    """
+    heights = heights or [input_shape[1]]
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    def key(point):
+        return (point["model"], point["device"], point["batch"], point["precision"], point["threads"], point["height"],
+                point.get("nstreams"))
+
+    results = {}
+    if os.path.exists(output):
+        with open(output) as f:
+            for line in f:
+                if line.strip():
+                    point = json.loads(line)
+                    results[key(point)] = point
+        print(f"Resuming from {output}: {len(results)} points already done")
+
+    grid = list(itertools.product(batches, precisions, threads_list, heights))
+    print(f"\nSweeping {len(grid) * len(nstreams_list)} points for up to 2 x {bench_time}sec each, results in {output}")
+    with open(output, "a") as f:
+        for batch, precision, threads, height in grid:
+            label = f"batch {batch:>2}, {precision:>4}, threads {threads or 'default':>7}, H {height}"
+            base_config = {"INFERENCE_PRECISION_HINT": precision}
+            if threads:
+                base_config["INFERENCE_NUM_THREADS"] = str(threads)
+            model = inputs = sync = latency_precision = None
+            for nstreams in nstreams_list:
+                point = {"model": ir_path, "device": device, "batch": batch, "precision": precision,
+                         "threads": threads, "height": height, "nstreams": str(nstreams)}
+                if key(point) in results:
+                    continue
+                try:
+                    if latency_precision is None:
+                        model = load_sweep_model(ie, ir_path, input_shape, batch, height)
+                        compiled_model = ie.compile_model(model=model, device_name=device,
+                                                          config={**base_config, "PERFORMANCE_HINT": "LATENCY"})
+                        # The CPU plugin quietly stays on f32 for a hint it does not support
+                        latency_precision = effective_precision(compiled_model)
+                        if latency_precision == precision:
+                            inputs = np.random.randn(*tuple(compiled_model.input(0).shape)).astype(np.float32)
+                            sync = np.array(measure_sync_latency(compiled_model, inputs, bench_time)) * 1000
+                        del compiled_model
+
+                    point["effective_precision"] = latency_precision
+                    if sync is not None:
+                        config = {**base_config, "PERFORMANCE_HINT": "THROUGHPUT"}
+                        if nstreams != "AUTO":
+                            config["NUM_STREAMS"] = str(nstreams)
+                        compiled_model = ie.compile_model(model=model, device_name=device, config=config)
+                        point["effective_precision"] = effective_precision(compiled_model)
+                    if point["effective_precision"] != precision:
+                        # Recorded so a resumed sweep does not retry it, and kept out of the frontier
+                        point["skipped"] = f"{device} runs {point['effective_precision']} when asked for {precision}"
+                        print(f"{label}, NUM_STREAMS {nstreams}: skipped: {point['skipped']}")
+                    else:
+                        nireq = compiled_model.get_property("OPTIMAL_NUMBER_OF_INFER_REQUESTS")
+                        fps, latencies = run_async(compiled_model, nireq, {0: inputs}, bench_time)
+                        del compiled_model
+                        lat_ms = np.array(latencies) * 1000
+                        point.update({
+                            "nireq": nireq,
+                            "fps": batch * fps,
+                            "latency_median_ms": float(np.median(lat_ms)),
+                            "latency_p90_ms": float(np.percentile(lat_ms, 90)),
+                            "sync_latency_median_ms": float(np.median(sync)),
+                        })
+                        print(f"{label}, NUM_STREAMS {nstreams}: FPS {point['fps']:>8.2f}, latency median "
+                              f"{point['latency_median_ms']:.2f} ms ({nireq} requests), single request "
+                              f"{point['sync_latency_median_ms']:.2f} ms")
+                except Exception as e:
+                    # Recorded so a resumed sweep does not retry it
+                    point["error"] = str(e)
+                    print(f"{label}, NUM_STREAMS {nstreams}: failed: {e}")
+                f.write(json.dumps(point) + "\n")
+                f.flush()
+                results[key(point)] = point
+
+    # Points from before the NUM_STREAMS axis measured FPS synchronously; leave them out
+    points = [p for p in results.values() if "error" not in p and "skipped" not in p and "nstreams" in p
+              and p["model"] == ir_path and p["device"] == device]
+    if not points:
+        print("No successful points")
+        return
+    print("\nPareto frontier of request latency vs. FPS under the THROUGHPUT hint "
+          "(no other point has both lower latency and higher FPS):")
+    print(f"{'Batch':>6}{'Precision':>11}{'Threads':>9}{'H':>6}{'Streams':>9}{'Latency ms':>12}{'p90 ms':>10}"
+          f"{'FPS':>10}{'Single ms':>11}")
+    for p in pareto_frontier(points):
+        print(f"{p['batch']:>6}{p['precision']:>11}{p['threads'] or 'default':>9}{p['height']:>6}{p['nstreams']:>9}"
+              f"{p['latency_median_ms']:>12.2f}{p['latency_p90_ms']:>10.2f}{p['fps']:>10.2f}"
+              f"{p['sync_latency_median_ms']:>11.2f}")
+    print()
+
+STARTUP_STRATEGIES = ["cold", "cold_mmap", "cache_warm", "blob_import"]
+STARTUP_RESULT = "STARTUP_RESULT "
+
+def read_rss_mb():
+    """Current and peak RSS of this process in MB (Linux)."""
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss / 2**20, peak / 2**20
+
+def startup_worker(strategy, ir_path, input_shape, device, cache_dir, blob_path):
+    """Load the model with one strategy, run one inference and print the timings as JSON.
+
+    Runs in a fresh process started by benchmark_startup, so nothing is shared between
+    strategies except the OS page cache.
+    """
+    # Made before the clock starts: the input is not part of model startup
+    dummy_input = np.random.randn(*tuple(input_shape)).astype(np.float32)
+    timings = {}
+    start_time = time.perf_counter()
+    ie = Core()
+    config = {}
+    if strategy == "cold":
+        ie.set_property({"ENABLE_MMAP": False})
+    elif strategy in ("cold_mmap", "export"):
+        ie.set_property({"ENABLE_MMAP": True})
+    elif strategy == "cache_warm":
+        config["CACHE_DIR"] = cache_dir
+
+    step = time.perf_counter()
+    if strategy == "blob_import":
+        with open(blob_path, "rb") as f:
+            blob = f.read()
+        timings["read"] = time.perf_counter() - step
+        step = time.perf_counter()
+        compiled_model = ie.import_model(blob, device)
+        timings["compile"] = time.perf_counter() - step
+        del blob
+    else:
+        model = ie.read_model(ir_path)
+        timings["read"] = time.perf_counter() - step
+        step = time.perf_counter()
+        model.reshape(input_shape)
+        timings["reshape"] = time.perf_counter() - step
+        step = time.perf_counter()
+        compiled_model = ie.compile_model(model, device, config)
+        timings["compile"] = time.perf_counter() - step
+
+    if strategy == "export":
+        with open(blob_path, "wb") as f:
+            f.write(compiled_model.export_model())
+
+    step = time.perf_counter()
+    compiled_model([dummy_input])
+    timings["first_infer"] = time.perf_counter() - step
+    timings["ttfi"] = time.perf_counter() - start_time
+    timings["rss_mb"], timings["peak_rss_mb"] = read_rss_mb()
+    print(STARTUP_RESULT + json.dumps(timings), flush=True)
+
+def run_startup_worker(strategy, ir_path, input_shape, device, cache_dir, blob_path):
+    cmd = [sys.executable, os.path.abspath(__file__), "--startup-worker", strategy,
+           "-m", ir_path, "-d", device, "--shape", *map(str, input_shape),
+           "--cache-dir", cache_dir, "--blob", blob_path]
+    start_time = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    wall_time = time.perf_counter() - start_time
+    for line in proc.stdout.splitlines():
+        if line.startswith(STARTUP_RESULT):
+            result = json.loads(line[len(STARTUP_RESULT):])
+            # Includes interpreter start-up and `import openvino`
+            result["process"] = wall_time
+            return result
+    raise RuntimeError(f"Startup worker '{strategy}' failed:\n{proc.stderr}")
+
+def benchmark_startup(ir_path, input_shape, device="CPU", cache_dir="./rp-output/ov-cache",
+                      blob_path="./rp-output/model.blob", runs=3):
+    """Compare time-to-first-inference and memory of the model loading strategies.
+
+    Every measurement runs in its own process so that nothing compiled or allocated by one
+    strategy is reused by the next. The OS page cache is shared, so the IR and blob files
+    are read warm after the first run.
+    """
+    print(f"\nBenchmarking startup on {device}, {runs} runs per strategy in fresh processes")
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(blob_path)), exist_ok=True)
+
+    # Populate CACHE_DIR and write the exported blob; not measured
+    print(f"Preparing CACHE_DIR {cache_dir} and blob {blob_path}...")
+    run_startup_worker("cache_warm", ir_path, input_shape, device, cache_dir, blob_path)
+    run_startup_worker("export", ir_path, input_shape, device, cache_dir, blob_path)
+    print(f"Blob size: {os.path.getsize(blob_path) / 2**20:.1f} MB")
+
+    results = {strategy: [] for strategy in STARTUP_STRATEGIES}
+    for run in range(runs):
+        # Interleave the strategies so drift (thermal, page cache) hits them all alike
+        for strategy in STARTUP_STRATEGIES:
+            results[strategy].append(
+                run_startup_worker(strategy, ir_path, input_shape, device, cache_dir, blob_path))
+
+    columns = ["read", "reshape", "compile", "first_infer", "ttfi", "process"]
+    print(f"\nMedian of {runs} runs, times in ms (compile is import_model for blob_import; "
+          f"process includes interpreter start-up):")
+    header = f"{'Strategy':<12}" + "".join(f"{c:>12}" for c in columns) + f"{'RSS MB':>10}{'Peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for strategy, runs_list in results.items():
+        row = f"{strategy:<12}"
+        for column in columns:
+            values = [r[column] for r in runs_list if column in r]
+            row += f"{np.median(values) * 1000:>12.1f}" if values else f"{'-':>12}"
+        row += f"{np.median([r['rss_mb'] for r in runs_list]):>10.1f}"
+        row += f"{np.median([r['peak_rss_mb'] for r in runs_list]):>10.1f}"
+        print(row)
 
-input_shape = [3, 736, 1200]
-model.reshape(input_shape)
+    fastest = min(results, key=lambda s: np.median([r["ttfi"] for r in results[s]]))
+    cold = np.median([r["ttfi"] for r in results["cold"]])
+    best = np.median([r["ttfi"] for r in results[fastest]])
+    print(f"\nFastest time-to-first-inference: {fastest} ({cold / best:.1f}x faster than cold)\n")
 
-# Compile the model
-compiled_model = ie.compile_model(model=model, device_name="CPU")
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detectron2 OpenVINO IR")
+    parser.add_argument("-m", "--model", default=IR_PATH, help="Path to the IR model.xml")
+    parser.add_argument("-d", "--device", default="CPU", help="OpenVINO device. Default is CPU.")
+    parser.add_argument("--mode", choices=["latency", "throughput", "buckets", "pipeline", "startup", "int8", "sweep"], default="latency",
+                        help="latency: synchronous single-stream; throughput: AsyncInferQueue sweep over streams; "
+                             "buckets: mixed image heights through per-height compiled models; "
+                             "pipeline: real images with threaded preprocessing; "
+                             "startup: time-to-first-inference of the model loading strategies; "
+                             "int8: NNCF post-training quantization and FP32 vs. INT8 comparison; "
+                             "sweep: batch / precision / threads / height grid with a Pareto frontier.")
+    parser.add_argument("-t", "--time", type=float, default=5, help="Benchmark time in seconds (per config in throughput mode).")
+    parser.add_argument("--shape", type=int, nargs=3, default=INPUT_SHAPE, metavar=("C", "H", "W"), help="Input shape [C,H,W].")
+    parser.add_argument("--nstreams", nargs="+", help="NUM_STREAMS values for throughput mode (numbers or AUTO). Default is 1, 2, 4 ... cores, AUTO.")
+    parser.add_argument("--nireq-per-stream", type=int, nargs="+", default=[1, 2], help="Infer requests per stream to try in throughput mode. Default is 1 2.")
+    parser.add_argument("--num-images", type=int, default=100, help="Number of mixed-height images in buckets mode. Default is 100.")
+    parser.add_argument("--max-compiled", type=int, default=3, help="Compiled models kept in memory in buckets mode (LRU). Default is 3.")
+    parser.add_argument("--cache-dir", default="./rp-output/ov-cache", help="OpenVINO CACHE_DIR for buckets and startup modes; empty string disables it in buckets mode.")
+    parser.add_argument("--compare-max", action="store_true", help="In buckets mode, also run every image padded to the largest bucket.")
+    parser.add_argument("--images", help="Directory of images for pipeline mode and INT8 calibration.")
+    parser.add_argument("--workers", type=int, default=4, help="Preprocessing threads in pipeline mode. Default is 4.")
+    parser.add_argument("--nireq", type=int, default=2, help="Infer requests in pipeline mode. Default is 2.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh-process runs per strategy in startup mode. Default is 3.")
+    parser.add_argument("--blob", default="./rp-output/model.blob", help="Exported compiled model for startup mode.")
+    parser.add_argument("--calib-samples", type=int, default=300, help="Calibration samples in int8 mode. Default is 300.")
+    parser.add_argument("--int8-model", help="INT8 IR path for int8 mode. Default is <model>_int8.xml; quantized if missing.")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1], help="Batch sizes for sweep mode (needs an NCHW input). Default is 1.")
+    parser.add_argument("--precision", nargs="+", default=["f32", "bf16"], help="INFERENCE_PRECISION_HINT values for sweep mode. Default is f32 bf16.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="INFERENCE_NUM_THREADS values for sweep mode, 0 for the plugin default. Default is 0.")
+    parser.add_argument("--heights", type=int, nargs="+", help="Input heights for sweep mode. Default is the --shape height.")
+    parser.add_argument("--sweep-nstreams", nargs="+", default=["AUTO"], help="NUM_STREAMS values (numbers or AUTO) for the throughput side of sweep mode. Default is AUTO.")
+    parser.add_argument("--sweep-output", default="./rp-output/sweep.jsonl", help="JSON lines file for sweep mode; existing points are skipped.")
+    parser.add_argument("--startup-worker", choices=STARTUP_STRATEGIES + ["export"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
 
-# get the names of input and output layers of the model
-input_layer = compiled_model.input(0)
-output_layer = compiled_model.output(0)
+    if args.startup_worker:
+        startup_worker(args.startup_worker, args.model, args.shape, args.device, args.cache_dir, args.blob)
+        return
 
-bench_time = 5 # benchmark time in seconds
-dummy_input = np.random.randn(*tuple(input_shape))
+    if args.mode == "startup":
+        print(f"Model: {args.model} ")
+        benchmark_startup(args.model, args.shape, args.device, args.cache_dir or "./rp-output/ov-cache",
+                          args.blob, args.runs)
+        return
 
-latency_arr = []
-end = time.time() + bench_time
+    ie = Core()
+    print(f"Model: {args.model} ")
 
-print(f"\nBenchmarking OpenVINO inference for {bench_time}sec...")
-print(f"Input shape: {dummy_input.shape}")
-print(f"Model: {ir_path} ")
+    if args.mode == "sweep":
+        benchmark_sweep(ie, args.model, args.shape, args.time, args.device, args.batch, args.precision,
+                        args.threads, args.heights,
+                        [n if n == "AUTO" else int(n) for n in args.sweep_nstreams], args.sweep_output)
+        return
 
-while time.time() < end:
-    start_time = time.time()
-    ov_result = compiled_model([dummy_input])
-    latency = time.time() - start_time
-    latency_arr.append(latency)
+    if args.mode == "int8":
+        benchmark_int8(ie, args.model, args.shape, args.time, args.device, args.images, args.calib_samples,
+                       args.int8_model)
+        return
 
-# Save the result for accuracy verificaiton
-print(f"Output shapes:")
-for out_nm in compiled_model.outputs:
-    print(f"{ov_result[out_nm].shape}")
+    if args.mode == "buckets":
+        if args.max_compiled < 1:
+            parser.error("--max-compiled must be at least 1")
+        benchmark_buckets(ie, args.model, args.shape, args.device, args.num_images, args.max_compiled,
+                          args.cache_dir or None, args.compare_max)
+        return
 
-avg_latency = np.array(latency_arr).mean()
-fps = 1 / avg_latency
+    model = load_model(ie, args.model, args.shape)
 
-print(f"\nAvg Latency: {avg_latency:.4f} sec, FPS: {fps:.2f}\n")
+    if args.mode == "pipeline":
+        if not args.images:
+            parser.error("--mode pipeline needs --images")
+        benchmark_pipeline(ie, model, args.shape, args.images, args.time, args.device, args.workers, args.nireq)
+    elif args.mode == "throughput":
+        nstreams_list = [n if n == "AUTO" else int(n) for n in args.nstreams] if args.nstreams else None
+        benchmark_throughput(ie, model, args.shape, args.time, args.device, nstreams_list, args.nireq_per_stream)
+    else:
+        benchmark_latency(ie, model, args.shape, args.time, args.device)
 
+if __name__ == "__main__":
+    main()
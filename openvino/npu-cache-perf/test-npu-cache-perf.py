@@ -1,17 +1,31 @@
 """
 OpenVINO NPU Caching Performance Benchmark Tool
 
+Every configuration runs in a fresh subprocess, so a "2nd Run" only benefits from what the
+1st run left on disk, as a restarted service would. The device can be NPU, GPU or CPU.
 """
 
 import time
 import os
+import math
+import random
 import shutil
+import statistics
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional
 import openvino as ov
 import openvino_genai as ov_genai
 import argparse
 
+try:
+    # Phase markers for utils/cpu-mem-profiler.py, which puts them on PYTHONPATH
+    from profiler_phases import phase
+except ImportError:
+    from contextlib import nullcontext as phase
+
 
 @dataclass
 class BenchmarkResult:
@@ -21,15 +35,165 @@ class BenchmarkResult:
     inference_time: float
     success: bool = True
     error_message: Optional[str] = None
+    # Generation breakdown; times in seconds, -1 when not measured
+    ttft: float = -1
+    inter_token_mean: float = -1
+    inter_token_p95: float = -1
+    tokens_per_sec: float = -1
+    generated_tokens: int = 0
+
+
+# Fewest runs for which median_ci() is a real 95% interval (coverage 1 - 2/2**6 = 96.9%);
+# with fewer it is just the min-max range
+MIN_CI_RUNS = 6
+
+
+def median_ci(values: List[float], confidence: float = 0.95) -> Tuple[float, float]:
+    """
+    Distribution-free confidence interval for the median from order statistics.
+
+    With too few values for the requested coverage the full range is returned.
+    Same as median_ci() in utils/cpu-mem-profiler.py, repeated so this script runs on its own.
+    """
+    values = sorted(values)
+    n = len(values)
+    # With B ~ Binomial(n, 0.5) values below the median, the coverage of
+    # [values[k], values[n - 1 - k]] is 1 - 2 * P(B <= k)
+    cdf = 0
+    lower = 0
+    for k in range(n // 2):
+        cdf += math.comb(n, k) / 2 ** n
+        if 1 - 2 * cdf < confidence:
+            break
+        lower = k
+    return values[lower], values[n - 1 - lower]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Median, quartiles and 95% confidence interval of the median (min-max range below MIN_CI_RUNS values)."""
+    ci_low, ci_high = median_ci(values)
+    return {
+        "median": statistics.median(values),
+        "q1": percentile(values, 25),
+        "q3": percentile(values, 75),
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "interval": "95% CI" if len(values) >= MIN_CI_RUNS else "min-max",
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolation percentile, as numpy's default."""
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lower = math.floor(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+def format_speedup(baseline: List[float], values: List[float]) -> str:
+    """Speedup of the medians, with bounds from the two intervals (marked min-max if either is one)."""
+    base, new = summarize(baseline), summarize(values)
+    speedup = base["median"] / new["median"]
+    low = base["ci_low"] / new["ci_high"]
+    high = base["ci_high"] / new["ci_low"]
+    label = " min-max" if "min-max" in (base["interval"], new["interval"]) else ""
+    return f"{speedup:.1f}x [{low:.1f}-{high:.1f}{label}]"
+
+
+PREFETCH_SUFFIX = " +prefetch"
+
+
+def _iter_files(paths: List[str]):
+    """All regular files under `paths`, which may be files or directories."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+        elif os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in filenames:
+                    yield os.path.join(dirpath, filename)
+
+
+def evict_from_page_cache(paths: List[str]) -> Tuple[int, int]:
+    """
+    Drop the pages of every file under `paths` from the OS page cache.
+
+    posix_fadvise(DONTNEED) needs no root, but only drops clean pages, so each file is
+    flushed first. Returns the number of files and bytes.
+    """
+    files = 0
+    total_bytes = 0
+    for path in _iter_files(paths):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            files += 1
+            total_bytes += os.fstat(fd).st_size
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return files, total_bytes
+
+
+def _read_file(path: str, chunk_size: int = 8 * 1024 * 1024) -> int:
+    """Read `path` once into a scratch buffer so it ends up in the page cache."""
+    buffer = bytearray(chunk_size)
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                return total
+            total += n
+
+
+def start_prefetch(paths: List[str], workers: int = 4) -> Tuple[threading.Thread, Dict[str, float]]:
+    """
+    Read every file under `paths` with `workers` threads in the background.
+
+    Meant to run while the benchmark process starts up and LLMPipeline initializes.
+    The returned dict gets 'bytes' and 'time' when the thread finishes, or 'error' if
+    reading failed.
+    """
+    stats = {}
+
+    def run():
+        start_time = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                stats["bytes"] = sum(pool.map(_read_file, list(_iter_files(paths))))
+        except Exception as e:
+            stats["error"] = str(e) or type(e).__name__
+        stats["time"] = time.perf_counter() - start_time
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, stats
+
+
+def _config_worker(conn, tool, pipeline_config: Dict[str, Any], config_name: str) -> None:
+    """Subprocess entry point: measure one configuration and send the BenchmarkResult back."""
+    conn.send(tool._measure_single_config(pipeline_config, config_name))
+    conn.close()
 
 
 class NpuCachePerfTool:
     """Benchmarks OpenVINO LLM pipeline performance with different caching strategies."""
     
-    def __init__(self, model_path: str, cache_base_dir: str, device: str = "NPU"):
+    def __init__(self, model_path: str, cache_base_dir: str, device: str = "NPU",
+                 evict: bool = False, prefetch: bool = False, prefetch_workers: int = 4):
         self.model_path = model_path
         self.cache_base_dir = cache_base_dir
         self.device = device
+        self.evict = evict
+        self.prefetch = prefetch
+        self.prefetch_workers = prefetch_workers
         self.blob_path = f"{cache_base_dir}/npu_cache_aot/compiled_model.blob"
         self.results = []
         
@@ -49,15 +213,25 @@ class NpuCachePerfTool:
             print(f"Created cache directory: {blob_dir}")
     
     def _print_environment_info(self) -> None:
-        """Print version information."""
+        """Print version information and the properties of the benchmarked device."""
         ov_core = ov.Core()
+        device_type = self.device.split(".")[0]
     
         print(f"OpenVINO version: {ov.__version__}")
         print(f"OpenVINO GenAI version: {ov_genai.__version__}")
-        print(f"CPU Name: {ov_core.get_property("CPU", "FULL_DEVICE_NAME")}")
-        print(f"NPU Driver: {ov_core.get_property('NPU', 'NPU_DRIVER_VERSION')}")
-        print(f"NPU_MAX_TILES: {ov_core.get_property('NPU', 'NPU_MAX_TILES')}")
-        print(f"NPU_DEVICE_TOTAL_MEM_SIZE: {ov_core.get_property('NPU', 'NPU_DEVICE_TOTAL_MEM_SIZE') / (1024 ** 3):.2f} GB")
+        print(f"CPU Name: {ov_core.get_property('CPU', 'FULL_DEVICE_NAME')}")
+        print(f"Device: {self.device}")
+        try:
+            if device_type == "NPU":
+                print(f"NPU Driver: {ov_core.get_property(self.device, 'NPU_DRIVER_VERSION')}")
+                print(f"NPU_MAX_TILES: {ov_core.get_property(self.device, 'NPU_MAX_TILES')}")
+                print(f"NPU_DEVICE_TOTAL_MEM_SIZE: {ov_core.get_property(self.device, 'NPU_DEVICE_TOTAL_MEM_SIZE') / (1024 ** 3):.2f} GB")
+            elif device_type == "GPU":
+                print(f"GPU Name: {ov_core.get_property(self.device, 'FULL_DEVICE_NAME')}")
+                print(f"GPU_DEVICE_TOTAL_MEM_SIZE: {ov_core.get_property(self.device, 'GPU_DEVICE_TOTAL_MEM_SIZE') / (1024 ** 3):.2f} GB")
+        except RuntimeError as e:
+            print(f"Cannot query {self.device} properties: {e}")
+        print(f"Available devices: {ov_core.available_devices}")
         print(f"Model path: {self.model_path}")
         print(f"Cache base directory: {self.cache_base_dir}")
         print("-" * 60)
@@ -83,6 +257,35 @@ class NpuCachePerfTool:
         return size_mb, file_count
     
     
+    def _generation_metrics(self, result, start_time: float, token_times: List[float]) -> Dict[str, Any]:
+        """
+        TTFT, inter-token latency, tokens/sec and token count of one generate() call.
+
+        ov_genai's perf_metrics are used where available; the inter-token mean and p95 both
+        come from its per-token durations (raw_metrics.m_durations, the data behind TPOT).
+        Without them, everything comes from the streamer timestamps, i.e. per streamed chunk,
+        which is one token except when the detokenizer holds back an incomplete word.
+        """
+        gaps = [b - a for a, b in zip(token_times, token_times[1:])]
+        metrics = {
+            "ttft": token_times[0] - start_time if token_times else -1,
+            "inter_token_mean": statistics.mean(gaps) if gaps else -1,
+            "inter_token_p95": percentile(gaps, 95) if gaps else -1,
+            "tokens_per_sec": len(token_times) / (token_times[-1] - start_time) if token_times else -1,
+            "generated_tokens": len(token_times),
+        }
+        perf_metrics = getattr(result, "perf_metrics", None)
+        if perf_metrics is not None:
+            # perf_metrics report milliseconds
+            metrics["ttft"] = perf_metrics.get_ttft().mean / 1000
+            durations = [d / 1000 for d in perf_metrics.raw_metrics.m_durations]
+            if durations:
+                metrics["inter_token_mean"] = statistics.mean(durations)
+                metrics["inter_token_p95"] = percentile(durations, 95)
+            metrics["tokens_per_sec"] = perf_metrics.get_throughput().mean
+            metrics["generated_tokens"] = perf_metrics.get_num_generated_tokens()
+        return metrics
+    
     def _measure_single_config(self, pipeline_config: Dict[str, Any], config_name: str) -> BenchmarkResult:
         """
         Measure performance for a single pipeline configuration.
@@ -95,13 +298,14 @@ class NpuCachePerfTool:
             BenchmarkResult containing timing data and success status
         """
         print(f"\nBenchmarking: {config_name}")
-        print(f"Configuration: {pipeline_config}")
+        print(f"Configuration: {pipeline_config}", flush=True)
         
         # Measure load time
         try:
-            start_time = time.time()
-            pipe = ov_genai.LLMPipeline(self.model_path, self.device, **pipeline_config)
-            compile_time = time.time() - start_time
+            start_time = time.perf_counter()
+            with phase(f"{config_name}: LLMPipeline"):
+                pipe = ov_genai.LLMPipeline(self.model_path, self.device, **pipeline_config)
+            compile_time = time.perf_counter() - start_time
             print(f"✓ Compile time: {compile_time:.2f} seconds")
         except Exception as e:
             error_msg = f"Failed to initialize pipeline: {e}"
@@ -113,10 +317,22 @@ class NpuCachePerfTool:
             prompt = "Sun is the largest "
             max_tokens = 50
             
-            start_time = time.time()
-            result = pipe.generate(prompt, max_new_tokens=max_tokens)
-            inference_time = time.time() - start_time
+            token_times = []
+
+            def streamer(subword):
+                token_times.append(time.perf_counter())
+                return False  # keep generating
+            
+            start_time = time.perf_counter()
+            with phase(f"{config_name}: generate"):
+                # A list prompt returns DecodedResults, which carries perf_metrics
+                result = pipe.generate([prompt], max_new_tokens=max_tokens, streamer=streamer)
+            inference_time = time.perf_counter() - start_time
             print(f"✓ Inference time: {inference_time:.2f} seconds")
+            generation = self._generation_metrics(result, start_time, token_times)
+            print(f"✓ TTFT: {generation['ttft'] * 1000:.1f} ms, inter-token mean "
+                  f"{generation['inter_token_mean'] * 1000:.1f} ms / p95 {generation['inter_token_p95'] * 1000:.1f} ms, "
+                  f"{generation['tokens_per_sec']:.1f} tokens/sec, {generation['generated_tokens']} tokens")
         except Exception as e:
             error_msg = f"Failed to generate text: {e}"
             print(f"✗ {error_msg}")
@@ -127,16 +343,51 @@ class NpuCachePerfTool:
                 del pipe
 
         
-        return BenchmarkResult(config_name, compile_time, inference_time)
+        return BenchmarkResult(config_name, compile_time, inference_time, **generation)
+    
+    def _measure_in_subprocess(self, pipeline_config: Dict[str, Any], config_name: str) -> BenchmarkResult:
+        """
+        Run _measure_single_config in a fresh interpreter, so no compiled state survives between runs.
+
+        For prefetch configurations the cache is read from here, starting before the child is
+        spawned, so the reads overlap its interpreter start-up and imports as well as LLMPipeline.
+        """
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_config_worker, args=(child_conn, self, pipeline_config, config_name))
+        prefetch = None
+        if config_name.endswith(PREFETCH_SUFFIX):
+            prefetch = start_prefetch(self._cache_paths(pipeline_config), self.prefetch_workers)
+        process.start()
+        child_conn.close()
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            # Died without reporting, e.g. a driver crash or the OOM killer
+            result = BenchmarkResult(config_name, -1, -1, False,
+                                     f"Benchmark process exited with code {process.exitcode}")
+        process.join()
+        if prefetch:
+            prefetch_thread, prefetch_stats = prefetch
+            prefetch_thread.join()
+            # Reported only; a failed prefetch leaves the measured load as it was
+            if "error" in prefetch_stats:
+                print(f"✗ Prefetch failed after {prefetch_stats['time']:.2f} seconds: {prefetch_stats['error']}")
+            else:
+                print(f"✓ Prefetched {prefetch_stats['bytes'] / 2**20:.1f} MB in {prefetch_stats['time']:.2f} seconds")
+        return result
     
     def _get_benchmark_configurations(self) -> Dict[str, Dict[str, Any]]:
         """
         Define all benchmark configurations to test.
+
+        NPUW_CACHE_DIR and the AOT blob (EXPORT_BLOB / BLOB_PATH) are NPU-only options, so
+        other devices get the CACHE_DIR configurations only.
         
         Returns:
             Dictionary mapping configuration names to their parameters
         """
-        return {
+        configurations = {
             "No Cache": {},
             
             "NPUW_CACHE_DIR (1st Run)": {
@@ -186,18 +437,147 @@ class NpuCachePerfTool:
                 "CACHE_MODE": "OPTIMIZE_SPEED"
             }
         }
+        if not self.device.startswith("NPU"):
+            configurations = {name: params for name, params in configurations.items()
+                              if not name.startswith(("NPUW_CACHE_DIR", "AOT Compilation"))}
+        if self.prefetch:
+            # Every 2nd Run again, with its cache files read in the background during init
+            with_prefetch = {}
+            for name, params in configurations.items():
+                with_prefetch[name] = params
+                if "(2nd Run)" in name:
+                    with_prefetch[name + PREFETCH_SUFFIX] = params
+            configurations = with_prefetch
+        return configurations
+    
+    def _cache_paths(self, pipeline_config: Dict[str, Any]) -> List[str]:
+        """Cache directories and blob files a configuration reads or writes."""
+        return [pipeline_config[key] for key in ("NPUW_CACHE_DIR", "CACHE_DIR", "BLOB_PATH") if key in pipeline_config]
+    
+    def _clear_cache(self, pipeline_config: Dict[str, Any]) -> None:
+        """Remove only the cache of this configuration, so other configurations keep theirs."""
+        for path in self._cache_paths(pipeline_config):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
     
-    def run_benchmark(self) -> None:
-        """Run the complete benchmark suite."""
+    def _cache_populated(self, pipeline_config: Dict[str, Any]) -> bool:
+        for path in self._cache_paths(pipeline_config):
+            if os.path.isdir(path) and not os.listdir(path):
+                return False
+            if not os.path.exists(path):
+                return False
+        return True
+    
+    def run_benchmark(self, repetitions: int = 1, seed: Optional[int] = None) -> None:
+        """
+        Run every configuration `repetitions` times in random order.
+
+        A 1st Run removes its own cache before it starts, so it always compiles cold. A 2nd
+        Run reuses whatever cache its 1st Run left; if there is none yet, an untimed 1st Run
+        populates it first.
+        """
         print("Starting OpenVINO LLM Pipeline Benchmark")
         print("=" * 60)
         
         configurations = self._get_benchmark_configurations()
+        trials = [name for name in configurations for _ in range(repetitions)]
+        random.Random(seed).shuffle(trials)
         
-        for config_name, config_params in configurations.items():
-            result = self._measure_single_config(config_params, config_name)
+        for i, config_name in enumerate(trials, 1):
+            print(f"\n[Trial {i}/{len(trials)}]")
+            config_params = configurations[config_name]
+            if "(1st Run)" in config_name:
+                self._clear_cache(config_params)
+            elif "(2nd Run)" in config_name and not self._cache_populated(config_params):
+                first_run = self._first_run_name(config_name)
+                print(f"Cache for {config_name} is empty; populating it with an untimed {first_run}")
+                self._clear_cache(configurations[first_run])
+                self._measure_in_subprocess(configurations[first_run], f"{first_run} [populate]")
+            if self.evict:
+                files, evicted = evict_from_page_cache([self.model_path] + self._cache_paths(config_params))
+                print(f"Evicted {files} files ({evicted / 2**20:.1f} MB) from the page cache")
+            result = self._measure_in_subprocess(config_params, config_name)
             self.results.append(result)
+    
+    def _first_run_name(self, config_name: str) -> str:
+        return config_name.replace("(2nd Run)", "(1st Run)").replace(PREFETCH_SUFFIX, "")
+    
+    def _results_by_config(self) -> Dict[str, List[BenchmarkResult]]:
+        """Trials grouped by configuration, in the order the configurations are defined."""
+        grouped = {name: [] for name in self._get_benchmark_configurations()}
+        for result in self.results:
+            grouped.setdefault(result.config_name, []).append(result)
+        return {name: results for name, results in grouped.items() if results}
+    
+    def _print_times(self, title: str, field: str) -> None:
+        """Print median [CI] and IQR of `field` per configuration, with speedups vs No cache and vs the 1st run."""
+        print(f"\n{title} (median [interval], IQR, successful runs):")
+        print("-" * 100)
+        
+        samples = {}
+        for config_name, results in self._results_by_config().items():
+            samples[config_name] = [getattr(r, field) for r in results if r.success and getattr(r, field) >= 0]
+        
+        names = list(samples)
+        for i, (config_name, values) in enumerate(samples.items()):
+            line = f"{config_name:<40}: "
+            # Blank line after the last configuration of each family
+            family_ends = i + 1 == len(names) or names[i + 1].split(" (")[0] != config_name.split(" (")[0]
+            if not values:
+                print(line + f"{'FAILED':>8}")
+                print() if family_ends else None
+                continue
+            stats = summarize(values)
+            line += (f"{stats['median']:>8.2f} sec [{stats['ci_low']:.2f}, {stats['ci_high']:.2f} {stats['interval']}], "
+                     f"IQR {stats['q3'] - stats['q1']:.2f}, n={len(values)}")
             
+            parts = []
+            no_cache = samples.get("No Cache")
+            if config_name != "No Cache" and no_cache:
+                parts.append(f"{format_speedup(no_cache, values)} vs No cache")
+            first_run = samples.get(self._first_run_name(config_name))
+            if "(2nd Run)" in config_name and first_run:
+                parts.append(f"{format_speedup(first_run, values)} vs 1st run")
+            if parts:
+                line += " (" + "; ".join(parts) + ")"
+            print(line)
+            print() if family_ends else None
+    
+    def _print_generation_metrics(self) -> None:
+        """Print the median first-token latency, inter-token latency, tokens/sec and token count per configuration."""
+        print("\nGENERATION BREAKDOWN (medians over successful runs):")
+        print("-" * 100)
+        print(f"{'Configuration':<40}  {'TTFT ms':>9} {'ITL mean ms':>12} {'ITL p95 ms':>11} {'Tokens/s':>9} {'Tokens':>7}")
+        for config_name, results in self._results_by_config().items():
+            results = [r for r in results if r.success and r.ttft >= 0]
+            if not results:
+                print(f"{config_name:<40}: {'FAILED':>9}")
+                continue
+
+            def med(field):
+                return statistics.median(getattr(r, field) for r in results)
+
+            print(f"{config_name:<40}: {med('ttft') * 1000:>9.1f} {med('inter_token_mean') * 1000:>12.1f} "
+                  f"{med('inter_token_p95') * 1000:>11.1f} {med('tokens_per_sec'):>9.1f} {med('generated_tokens'):>7.0f}")
+    
+    def _print_prefetch_savings(self) -> None:
+        """Print how much of the 2nd Run load time the background prefetch hides."""
+        print(f"\nPREFETCH ({'page cache evicted before every run' if self.evict else 'page cache NOT evicted'}):")
+        print("-" * 100)
+        grouped = self._results_by_config()
+        for config_name, results in grouped.items():
+            if not config_name.endswith(PREFETCH_SUFFIX):
+                continue
+            base = [r.compile_time for r in grouped.get(config_name[:-len(PREFETCH_SUFFIX)], []) if r.success]
+            with_prefetch = [r.compile_time for r in results if r.success]
+            if not base or not with_prefetch:
+                continue
+            hidden = statistics.median(base) - statistics.median(with_prefetch)
+            print(f"{config_name[:-len(PREFETCH_SUFFIX)]:<40}: {hidden:>6.2f} sec of {statistics.median(base):.2f} sec "
+                  f"hidden ({hidden / statistics.median(base) * 100:.0f}%)")
+    
     def print_summary(self) -> None:
         """Print a comprehensive summary of all benchmark results."""
         print("\n" + "=" * 60)
@@ -208,67 +588,13 @@ class NpuCachePerfTool:
             print("No results to display.")
             return
 
-        # Assume "No Cache" is always the first result
-        no_cache_result = self.results[0] if self.results[0].config_name == "No Cache" else None
-
-        print("\nLOAD/COMPILE TIMES:")
-        print("-" * 75)
-
-        prev_result = None
-        for i, result in enumerate(self.results):
-            line = f"{result.config_name:<35}: "
-            if result.success and result.compile_time >= 0:
-                line += f"{result.compile_time:>8.2f} sec"
-                parts = []
-
-                # Skip speedup for "No Cache" (i == 0)
-                if i > 0:
-                    if no_cache_result and no_cache_result.success and no_cache_result.compile_time > 0:
-                        speedup_vs_no_cache = no_cache_result.compile_time / result.compile_time
-                        parts.append(f"{speedup_vs_no_cache:.1f}x vs No cache")
-
-                    # For 2nd Run: also show speedup vs 1st Run
-                    if "(2nd Run)" in result.config_name and prev_result and prev_result.success and prev_result.compile_time > 0:
-                        speedup_vs_1st = prev_result.compile_time / result.compile_time
-                        parts.append(f"{speedup_vs_1st:.1f}x vs 1st run")
-
-                    if parts:
-                        line += " (" + "; ".join(parts) + ")"
-                    else:
-                        line += f"{'FAILED':>8}"
-            print(line)
-            print() if "(1st Run)" not in result.config_name else None
-            prev_result = result
-
-        print("\nINFERENCE TIMES:")
-        print("-" * 75)
-
-        prev_result = None
-        for i, result in enumerate(self.results):
-            line = f"{result.config_name:<35}: "
-            if result.success and result.inference_time >= 0:
-                line += f"{result.inference_time:>8.2f} sec"
-                parts = []
-
-                # Skip speedup for "No Cache" (i == 0)
-                if i > 0:
-                    if no_cache_result and no_cache_result.success and no_cache_result.inference_time > 0:
-                        speedup_vs_no_cache = no_cache_result.inference_time / result.inference_time
-                        parts.append(f"{speedup_vs_no_cache:.1f}x vs No cache")
-
-                    # For 2nd Run: show speedup vs 1st Run
-                    if "(2nd Run)" in result.config_name and prev_result and prev_result.success and prev_result.inference_time > 0:
-                        speedup_vs_1st = prev_result.inference_time / result.inference_time
-                        parts.append(f"{speedup_vs_1st:.1f}x vs 1st run")
-
-                    if parts:
-                        line += " (" + "; ".join(parts) + ")"
-                    else:
-                        line += f"{'FAILED':>8}"
-            print(line)
-            print() if "(1st Run)" not in result.config_name else None
-
-            prev_result = result
+        self._print_times("LOAD/COMPILE TIMES", "compile_time")
+        self._print_times("INFERENCE TIMES", "inference_time")
+        print(f"Intervals are 95% confidence intervals of the median from {MIN_CI_RUNS} successful runs on, "
+              f"min-max ranges below that.\nSpeedups are ratios of medians; the bounds combine the two intervals.")
+        self._print_generation_metrics()
+        if self.prefetch:
+            self._print_prefetch_savings()
 
         # Print any errors
         failed_results = [r for r in self.results if not r.success]
@@ -308,10 +634,23 @@ class NpuCachePerfTool:
 def main():
     # Configuration
     parser = argparse.ArgumentParser(description="OpenVINO NPU Cache Performance Benchmark Tool")
+    parser.add_argument("-d", "--device", type=str, default="NPU",
+                        help="Device to benchmark: NPU, GPU or CPU (CPU is handy for testing the tool)")
     parser.add_argument("-m", "--model-path", type=str, default="llama-3.2-1b-instruct-npu-ov",
                         help="Path or name of the model to benchmark")
     parser.add_argument("-c", "--cache-base-dir", type=str, default="ov-npu-cache",
                         help="Base directory for cache storage")
+    parser.add_argument("-n", "--repetitions", type=int, default=MIN_CI_RUNS,
+                        help=f"Runs per configuration, in random order (default {MIN_CI_RUNS}, the fewest "
+                             f"that give a 95%% confidence interval of the median)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for the run order (default: random)")
+    parser.add_argument("--evict", action="store_true",
+                        help="Evict the model and cache files from the OS page cache before every run (cold disk reads)")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="Also run every 2nd Run while reading its cache files in background threads")
+    parser.add_argument("--prefetch-workers", type=int, default=4,
+                        help="Threads reading cache files for --prefetch")
     args = parser.parse_args()
 
     model_path = args.model_path
@@ -319,8 +658,9 @@ def main():
     
     # Run benchmark
     start = time.time()
-    npu_cache_perf_tool = NpuCachePerfTool(model_path, cache_base_dir)
-    npu_cache_perf_tool.run_benchmark()
+    npu_cache_perf_tool = NpuCachePerfTool(model_path, cache_base_dir, args.device,
+                                           args.evict, args.prefetch, args.prefetch_workers)
+    npu_cache_perf_tool.run_benchmark(args.repetitions, args.seed)
     npu_cache_perf_tool.print_summary()
     npu_cache_perf_tool.print_cache_dir_info()
     print(f"\nTotal time taken: {time.time() - start:.2f} seconds")
@@ -1,32 +1,63 @@
 import time
+import functools
+from collections import defaultdict
 from diffusers import UNet2DConditionModel, DiffusionPipeline, LCMScheduler
 import torch
 from PIL import Image
 import openvino.torch
 from typing import Dict, Tuple, List
 import json
+import csv
 from datetime import datetime
 from enum import Enum, auto
 import numpy as np
 import argparse
 import sys
 import importlib.metadata
+import os
+import shutil
+import tempfile
+import resource
+import multiprocessing
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Phase markers for utils/cpu-mem-profiler.py, which puts them on PYTHONPATH
+    from profiler_phases import phase
+except ImportError:
+    from contextlib import nullcontext as phase
 
 class RunMode(Enum):
     EAGER = "eager"
     TC_INDUCTOR = "tc_inductor"
     TC_OPENVINO = "tc_openvino"
+    OV_NATIVE = "ov_native"
 
-def setup_pipeline(run_mode: str, ckpt: str, dtype=torch.float16) -> DiffusionPipeline:
+def setup_pipeline(run_mode: str, ckpt: str, dtype=torch.float16, cache_dir: str = None,
+                   static_shape: Tuple[int, int] = None, ov_model_dir: str = None,
+                   num_threads: int = None) -> DiffusionPipeline:
     """
     Setup the diffusion pipeline based on run mode configuration
     
     Args:
-        run_mode: One of 'eager', 'tc_inductor', or 'tc_openvino'
+        run_mode: One of 'eager', 'tc_inductor', 'tc_openvino' or 'ov_native'
         ckpt: Path to the model checkpoint
         dtype: Model dtype
+        cache_dir: Persistent compile cache root; each compiled mode uses its own subdirectory
+        static_shape: (height, width) to compile the ov_native models for; dynamic if None
+        ov_model_dir: Exported IR for ov_native, created from `ckpt` if missing
+        num_threads: torch and OpenVINO inference threads; library defaults if None
     """
     print(f"\nInitializing pipeline with mode: {run_mode}")
+    if cache_dir:
+        cache_dir = os.path.join(cache_dir, run_mode)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if run_mode == RunMode.OV_NATIVE.value:
+        return setup_ov_pipeline(ckpt, dtype, ov_model_dir, cache_dir, static_shape, num_threads)
     
     # Set compile options based on run mode
     if run_mode == RunMode.TC_OPENVINO.value:
@@ -34,9 +65,19 @@ def setup_pipeline(run_mode: str, ckpt: str, dtype=torch.float16) -> DiffusionPi
             'backend': 'openvino',
             'options': {'device': 'CPU', 'config': {'PERFORMANCE_HINT': 'LATENCY'}}
         }
+        if cache_dir:
+            compile_options['options'].update({'model_caching': True, 'cache_dir': cache_dir})
+        if num_threads:
+            compile_options['options']['config']['INFERENCE_NUM_THREADS'] = str(num_threads)
         print(f"Using OpenVINO backend with options: {compile_options}")
     elif run_mode == RunMode.TC_INDUCTOR.value:
         compile_options = {'backend': 'inductor', 'options': {}}
+        if cache_dir:
+            # Read by inductor when it compiles, i.e. on the first call
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+            os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] = "1"
+            torch._inductor.config.fx_graph_cache = True
+            print(f"Using inductor FX graph cache in {cache_dir}")
         print(f"Using Inductor backend with options: {compile_options}")
     else:  # eager mode
         compile_options = {}
@@ -57,8 +98,149 @@ def setup_pipeline(run_mode: str, ckpt: str, dtype=torch.float16) -> DiffusionPi
     pipe.to("cpu")
     return pipe
 
-def run_inference(pipe: DiffusionPipeline, params: Dict, iteration: int = 0) -> Tuple[Image.Image, float]:
+OV_PRECISION_HINTS = {torch.float32: "f32", torch.bfloat16: "bf16", torch.float16: "f16"}
+
+def setup_ov_pipeline(ckpt: str, dtype, ov_model_dir: str, cache_dir: str = None,
+                      static_shape: Tuple[int, int] = None, num_threads: int = None):
+    """
+    Setup the native OpenVINO pipeline (optimum-intel) from exported IR, exporting it on first use
+
+    The IR is exported once in fp32 with the LCM UNet and scheduler; `dtype` only selects the
+    INFERENCE_PRECISION_HINT. With `static_shape` (height, width) the models are reshaped to
+    batch 1 at that resolution before compiling.
+    """
+    from optimum.intel import OVStableDiffusionXLPipeline
+
+    if not os.path.isdir(ov_model_dir):
+        print(f"Exporting {ckpt} with the LCM UNet to OpenVINO IR in {ov_model_dir}...")
+        unet = UNet2DConditionModel.from_pretrained(f"{ckpt}/lcm/", torch_dtype=torch.float32)
+        pipe = DiffusionPipeline.from_pretrained(ckpt, unet=unet, torch_dtype=torch.float32)
+        pipe.scheduler = LCMScheduler.from_config(pipe.scheduler.config)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pipe.save_pretrained(tmp_dir)
+            del pipe, unet
+            OVStableDiffusionXLPipeline.from_pretrained(tmp_dir, export=True, compile=False).save_pretrained(ov_model_dir)
+
+    ov_config = {"PERFORMANCE_HINT": "LATENCY", "INFERENCE_PRECISION_HINT": OV_PRECISION_HINTS[dtype]}
+    if cache_dir:
+        ov_config["CACHE_DIR"] = cache_dir
+    if num_threads:
+        ov_config["INFERENCE_NUM_THREADS"] = str(num_threads)
+    print(f"Using native OpenVINO pipeline from {ov_model_dir} with config: {ov_config}")
+    pipe = OVStableDiffusionXLPipeline.from_pretrained(ov_model_dir, ov_config=ov_config, compile=False)
+    pipe.scheduler = LCMScheduler.from_config(pipe.scheduler.config)
+    if static_shape:
+        height, width = static_shape
+        pipe.reshape(batch_size=1, height=height, width=width, num_images_per_prompt=1)
+    pipe.compile()
+    return pipe
+
+def effective_precision(run_mode: str, pipe, dtype) -> str:
+    """
+    Precision the UNet actually runs in, as an OpenVINO type name ('f32', 'bf16', 'f16')
+
+    For ov_native this is what the compiled UNet reports: the CPU plugin quietly stays on f32
+    for an INFERENCE_PRECISION_HINT it does not support (e.g. f16 without AMX-FP16). The
+    torch modes run the weights' dtype.
+    """
+    if run_mode != RunMode.OV_NATIVE.value:
+        return OV_PRECISION_HINTS[dtype]
+    try:
+        request = pipe.unet.request
+        compiled_model = request.get_compiled_model() if hasattr(request, "get_compiled_model") else request
+        value = compiled_model.get_property("INFERENCE_PRECISION_HINT")
+        return value.get_type_name() if hasattr(value, "get_type_name") else str(value)
+    except Exception as e:
+        print(f"Could not read the effective precision of the ov_native UNet: {e}")
+        return "unknown"
+
+class TimedComponent:
+    """Stands in for a component that is not an nn.Module and reports the duration of each call"""
+    def __init__(self, component, record):
+        self._component = component
+        self._record = record
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        output = self._component(*args, **kwargs)
+        self._record(time.perf_counter() - start)
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self._component, name)
+
+class ComponentTimer:
+    """
+    Time every text encoder, UNet and vae.decode call of a pipeline with perf_counter
+
+    Modules get forward pre/post hooks, registered on the torch.compile wrapper so they run
+    outside the compiled graph; vae.decode is a plain function and is wrapped, and so are the
+    OpenVINO models of the ov_native pipeline. Calls are only recorded while `enabled` is set,
+    so the warm-up run is excluded.
+    """
+    def __init__(self, pipe: DiffusionPipeline):
+        self.times = defaultdict(list)
+        self.enabled = False
+        self.unet_step = 0
+        for name in ("text_encoder", "text_encoder_2", "unet"):
+            module = getattr(pipe, name, None)
+            if isinstance(module, torch.nn.Module):
+                self._hook_module(module, name)
+            elif module is not None:
+                setattr(pipe, name, TimedComponent(module, functools.partial(self._record, name)))
+        vae = getattr(pipe, "vae", None)
+        if vae is not None and hasattr(vae, "decode"):
+            vae.decode = self._wrap(vae.decode, "vae_decode")
+
+    def _record(self, name: str, elapsed: float):
+        if not self.enabled:
+            return
+        self.times[name].append(elapsed)
+        if name == "unet":
+            # One UNet call per denoising step (the guidance batch is a single call)
+            self.times[f"unet_step_{self.unet_step}"].append(elapsed)
+            self.unet_step += 1
+
+    def _hook_module(self, module: torch.nn.Module, name: str):
+        start = {}
+
+        def pre_hook(mod, args):
+            start["time"] = time.perf_counter()
+
+        def post_hook(mod, args, output):
+            self._record(name, time.perf_counter() - start["time"])
+
+        module.register_forward_pre_hook(pre_hook)
+        module.register_forward_hook(post_hook)
+
+    def _wrap(self, fn, name: str):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            output = fn(*args, **kwargs)
+            self._record(name, time.perf_counter() - start)
+            return output
+        return timed
+
+    def start_image(self):
+        self.unet_step = 0
+
+    def summary(self) -> Dict:
+        """Per-component call count, median, p95 and total time in seconds"""
+        return {
+            name: {
+                "calls": len(times),
+                "median": float(np.median(times)),
+                "percentile_95": float(np.percentile(times, 95)),
+                "total": float(np.sum(times))
+            }
+            for name, times in self.times.items()
+        }
+
+def run_inference(pipe: DiffusionPipeline, params: Dict, iteration: int = 0, timer: ComponentTimer = None) -> Tuple[Image.Image, float]:
     """Run inference and measure time"""
+    if timer is not None:
+        timer.start_image()
     start_time = time.time()
     image = pipe(
         params["prompt"],
@@ -74,26 +256,39 @@ def run_inference(pipe: DiffusionPipeline, params: Dict, iteration: int = 0) ->
     
     return image, execution_time
 
-def run_benchmark(run_mode: str, params: Dict, num_iter: int) -> Dict:
+def run_benchmark(run_mode: str, params: Dict, num_iter: int, num_threads: int = None) -> Dict:
     """Run a single benchmark configuration with multiple iterations"""
     try:
-        pipe = setup_pipeline(
-            run_mode,
-            params["ckpt"],
-            params["dtype"]
-        )
+        with phase(f"{run_mode}:setup_pipeline"):
+            pipe = setup_pipeline(
+                run_mode,
+                params["ckpt"],
+                params["dtype"],
+                params.get("cache_dir"),
+                (params["height"], params["width"]),
+                params.get("ov_model_dir"),
+                num_threads
+            )
+        precision = effective_precision(run_mode, pipe, params["dtype"])
+        if precision != OV_PRECISION_HINTS[params["dtype"]]:
+            print(f"Warning: {run_mode} runs in {precision}, not {OV_PRECISION_HINTS[params['dtype']]}")
         
+        timer = ComponentTimer(pipe)
+
         # Warm-up run
         print("\nPerforming warm-up run...")
-        warmup_image, warmup_time = run_inference(pipe, params, iteration=0)
+        with phase(f"{run_mode}:warmup"):
+            warmup_image, warmup_time = run_inference(pipe, params, iteration=0)
         
         # Benchmark iterations
         print(f"\nRunning {num_iter} benchmark iterations...")
         iteration_times = []
         final_image = None
+        timer.enabled = True
         
         for i in range(num_iter):
-            image, exec_time = run_inference(pipe, params, iteration=i+1)
+            with phase(f"{run_mode}:run_inference"):
+                image, exec_time = run_inference(pipe, params, iteration=i+1, timer=timer)
             iteration_times.append(exec_time)
             if i == num_iter - 1:
                 final_image = image
@@ -118,8 +313,10 @@ def run_benchmark(run_mode: str, params: Dict, num_iter: int) -> Dict:
         
         return {
             "run_mode": run_mode,
+            "effective_precision": precision,
             "warmup_time": warmup_time,
             "statistics": stats,
+            "components": timer.summary(),
             "warmup_image": warmup_image_filename,
             "final_image": final_image_filename,
             "status": "success"
@@ -132,6 +329,450 @@ def run_benchmark(run_mode: str, params: Dict, num_iter: int) -> Dict:
             "error": str(e)
         }
 
+def run_mode_worker(conn, run_mode: str, params: Dict, num_iter: int, cores: List[int] = None):
+    """Subprocess entry point: run one mode, optionally pinned to `cores`, and send the result back"""
+    if cores:
+        os.sched_setaffinity(0, cores)
+    # torch threads and, for the OpenVINO-backed modes, INFERENCE_NUM_THREADS match the core set
+    result = run_benchmark(run_mode, params, num_iter, len(cores) if cores else None)
+    # ru_maxrss is in KB on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if cores:
+        result["cores"] = format_cpu_list(cores)
+    conn.send(result)
+    conn.close()
+
+class RssMonitor:
+    """Track the peak RSS of this process over a window by polling /proc/self/statm in a thread"""
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        while True:
+            with open("/proc/self/statm") as f:
+                self.peak = max(self.peak, int(f.read().split()[1]) * page_size)
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def read_prompts(path: str) -> List[str]:
+    """One prompt per non-empty line"""
+    with open(path) as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    if not prompts:
+        raise ValueError(f"No prompts in {path}")
+    return prompts
+
+def run_throughput(pipe: DiffusionPipeline, params: Dict, run_mode: str, prompts: List[str], batch_size: int,
+                   images_per_prompt: int, num_batches: int, writer: ThreadPoolExecutor, output_dir: str) -> Dict:
+    """Generate `num_batches` batches of `batch_size` prompts and hand the images to the writer pool"""
+    prompt_cycle = itertools.cycle(prompts)
+
+    def call():
+        return pipe(
+            [next(prompt_cycle) for _ in range(batch_size)],
+            num_images_per_prompt=images_per_prompt,
+            num_inference_steps=params["num_inference_steps"],
+            guidance_scale=params["guidance_scale"],
+            height=params["height"],
+            width=params["width"],
+        ).images
+
+    # A new batch shape can trigger a recompile; keep it out of the measurement
+    call()
+
+    futures = []
+    num_images = 0
+    with RssMonitor() as rss:
+        start_time = time.perf_counter()
+        for i in range(num_batches):
+            images = call()
+            for j, image in enumerate(images):
+                filename = os.path.join(output_dir, f"image-{run_mode}-b{batch_size}-n{images_per_prompt}-{i}-{j}.png")
+                futures.append(writer.submit(image.save, filename))
+            num_images += len(images)
+        generate_time = time.perf_counter() - start_time
+        # Saving overlaps with generation; only the backlog left at the end adds to the total
+        for future in futures:
+            future.result()
+        total_time = time.perf_counter() - start_time
+
+    result = {
+        "batch_size": batch_size,
+        "num_images_per_prompt": images_per_prompt,
+        "images": num_images,
+        "images_per_sec": num_images / total_time,
+        "generate_images_per_sec": num_images / generate_time,
+        "save_backlog": total_time - generate_time,
+        "peak_rss_mb": rss.peak / 2**20
+    }
+    print(f"Batch {batch_size} x {images_per_prompt} images/prompt: {result['images_per_sec']:.3f} images/sec "
+          f"(generation only {result['generate_images_per_sec']:.3f}), peak RSS {result['peak_rss_mb']:.0f} MB")
+    return result
+
+def throughput_worker(conn, run_mode: str, params: Dict, prompts: List[str], batch_sizes: List[int],
+                      images_per_prompt_list: List[int], num_batches: int, output_dir: str, writers: int):
+    """Subprocess entry point: sweep batch sizes for one mode and send the results back"""
+    try:
+        pipe = setup_pipeline(run_mode, params["ckpt"], params["dtype"], params.get("cache_dir"),
+                              ov_model_dir=params.get("ov_model_dir"))
+        os.makedirs(output_dir, exist_ok=True)
+        sweep = []
+        with ThreadPoolExecutor(max_workers=writers) as writer:
+            for batch_size in batch_sizes:
+                for images_per_prompt in images_per_prompt_list:
+                    sweep.append(run_throughput(pipe, params, run_mode, prompts, batch_size, images_per_prompt,
+                                                num_batches, writer, output_dir))
+        result = {"run_mode": run_mode, "throughput": sweep, "status": "success"}
+    except Exception as e:
+        print(f"Error during benchmark: {str(e)}")
+        result = {"run_mode": run_mode, "status": "failed", "error": str(e)}
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    conn.send(result)
+    conn.close()
+
+def first_call_worker(conn, run_mode: str, params: Dict):
+    """Subprocess entry point: time pipeline setup and the first (compiling) call, and send them back"""
+    try:
+        start = time.perf_counter()
+        pipe = setup_pipeline(run_mode, params["ckpt"], params["dtype"], params.get("cache_dir"),
+                              (params["height"], params["width"]), params.get("ov_model_dir"))
+        setup_time = time.perf_counter() - start
+        start = time.perf_counter()
+        run_inference(pipe, params)
+        first_call = time.perf_counter() - start
+        result = {"run_mode": run_mode, "setup_time": setup_time, "first_call": first_call, "status": "success"}
+    except Exception as e:
+        result = {"run_mode": run_mode, "status": "failed", "error": str(e)}
+    conn.send(result)
+    conn.close()
+
+def start_mode_process(worker, run_mode: str, *args):
+    """Start `worker` for `run_mode` in a fresh interpreter, so no weights, compile caches or allocator state are shared"""
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=worker, args=(child_conn, run_mode, *args))
+    process.start()
+    # Only the child holds the write end now, so recv() fails instead of hanging if it dies
+    child_conn.close()
+    return process, parent_conn
+
+def collect_mode_result(run_mode: str, process, conn) -> Dict:
+    try:
+        result = conn.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        # Killed before sending anything, e.g. by the OOM killer (exit code -9)
+        result = {
+            "run_mode": run_mode,
+            "status": "failed",
+            "error": f"benchmark process exited with code {process.exitcode}"
+        }
+    return result
+
+def read_cpu_topology() -> Dict[Tuple[int, int], List[int]]:
+    """Usable physical cores as {(socket, core_id): [logical cpus]}, socket by socket (as in utils/cpu-mem-profiler.py)"""
+    cores = {}
+    for cpu in sorted(os.sched_getaffinity(0)):
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(os.path.join(topology, "physical_package_id")) as f:
+                socket = int(f.read())
+            with open(os.path.join(topology, "core_id")) as f:
+                core = int(f.read())
+        except (OSError, ValueError):
+            socket, core = 0, cpu
+        cores.setdefault((socket, core), []).append(cpu)
+    return dict(sorted(cores.items()))
+
+def format_cpu_list(cpus: List[int]) -> str:
+    """Format CPUs as a compact sysfs-style list such as '0-3,56-59'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else f"{a}" for a, b in ranges)
+
+def split_cores(num_parts: int, min_cores: int) -> List[List[int]]:
+    """
+    Split the physical cores this process may use into `num_parts` disjoint sets, or return None if too few
+
+    Every set gets whole cores (all their SMT siblings) and is filled from one socket before
+    the next; with as many parts as sockets, every part is one socket. `min_cores` counts
+    physical cores per set.
+    """
+    cores = read_cpu_topology()
+    sockets = {}
+    for (socket, _), cpus in cores.items():
+        sockets.setdefault(socket, []).append(cpus)
+    if num_parts > 1 and num_parts == len(sockets):
+        groups = list(sockets.values())
+    else:
+        core_list = list(cores.values())
+        per_part = len(core_list) // num_parts
+        groups = [core_list[i * per_part:(i + 1) * per_part] for i in range(num_parts)]
+    if min(len(g) for g in groups) < max(min_cores, 1):
+        return None
+    return [sorted(cpu for core in g for cpu in core) for g in groups]
+
+def packing_worker(conn, run_mode: str, params: Dict, num_iter: int, cores: List[int], barrier):
+    """Subprocess entry point: one pinned pipeline instance; measured iterations start together with the other instances"""
+    os.sched_setaffinity(0, cores)
+    try:
+        pipe = setup_pipeline(run_mode, params["ckpt"], params["dtype"], params.get("cache_dir"),
+                              (params["height"], params["width"]), params.get("ov_model_dir"), num_threads=len(cores))
+        run_inference(pipe, params, iteration=0)
+        barrier.wait()
+        start = time.perf_counter()
+        times = [run_inference(pipe, params, iteration=i + 1)[1] for i in range(num_iter)]
+        elapsed = time.perf_counter() - start
+        result = {
+            "run_mode": run_mode,
+            "cores": format_cpu_list(cores),
+            "images_per_sec": num_iter / elapsed,
+            "latency_median": float(np.median(times)),
+            "status": "success"
+        }
+    except Exception as e:
+        print(f"Error during benchmark: {str(e)}")
+        # Instances still waiting at the barrier would otherwise wait forever
+        barrier.abort()
+        # BrokenBarrierError (another instance failed) has no message
+        result = {"run_mode": run_mode, "status": "failed", "error": str(e) or type(e).__name__}
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    conn.send(result)
+    conn.close()
+
+def run_packing_point(run_mode: str, params: Dict, num_iter: int, core_sets: List[List[int]]) -> Dict:
+    """Run one pinned instance per core set at the same time and aggregate their results"""
+    barrier = multiprocessing.get_context("spawn").Barrier(len(core_sets))
+    processes = [start_mode_process(packing_worker, run_mode, params, num_iter, cores, barrier) for cores in core_sets]
+    instances = [None] * len(processes)
+    while None in instances:
+        for i, (process, conn) in enumerate(processes):
+            if instances[i] is None and (conn.poll(0.2) or not process.is_alive()):
+                instances[i] = collect_mode_result(run_mode, process, conn)
+                if instances[i]["status"] != "success":
+                    barrier.abort()
+
+    point = {
+        "instances": len(core_sets),
+        "threads_per_instance": len(core_sets[0]),
+        "per_instance": instances,
+        "status": "success" if all(r["status"] == "success" for r in instances) else "failed"
+    }
+    if point["status"] == "success":
+        point["images_per_sec"] = sum(r["images_per_sec"] for r in instances)
+        point["latency_median"] = float(np.median([r["latency_median"] for r in instances]))
+        point["latency_max"] = max(r["latency_median"] for r in instances)
+        # Sum of per-instance peaks: an upper bound on what the node needs at once
+        point["total_rss_mb"] = sum(r["peak_rss_mb"] for r in instances)
+        print(f"{run_mode}: {point['instances']} x {point['threads_per_instance']} threads: "
+              f"{point['images_per_sec']:.3f} images/sec, latency median {point['latency_median']:.2f} s, "
+              f"total RSS {point['total_rss_mb']:.0f} MB")
+    else:
+        errors = "; ".join(r["error"] for r in instances if r["status"] != "success")
+        print(f"{run_mode}: {point['instances']} x {point['threads_per_instance']} threads failed: {errors}")
+    return point
+
+def benchmark_packing(run_modes: List[str], params: Dict, num_iter: int, threads_list: List[int],
+                      instances_list: List[int]) -> List[Dict]:
+    """
+    Thread-count sweep for one pinned instance, then 1..K pinned instances sharing the cores
+
+    Every instance runs in its own process with torch.set_num_threads / INFERENCE_NUM_THREADS
+    equal to the size of its CPU set. The thread sweep takes one hardware thread per physical
+    core first (socket by socket) and SMT siblings only beyond that; instances get whole
+    physical cores, one socket each when there are as many instances as sockets.
+    """
+    cores = list(read_cpu_topology().values())
+    # First thread of every core, then the second threads, ...
+    cpus = [core[i] for i in range(max(len(core) for core in cores)) for core in cores if i < len(core)]
+    results = []
+    for mode in run_modes:
+        print("\n" + "="*50)
+        print(f"Packing study for run mode: {mode} on {len(cores)} cores ({len(cpus)} hardware threads)")
+        print("="*50)
+        points = []
+        for threads in threads_list or []:
+            if threads > len(cpus):
+                print(f"Skipping {threads} threads: only {len(cores)} cores ({len(cpus)} hardware threads) available")
+                continue
+            points.append(run_packing_point(mode, params, num_iter, [sorted(cpus[:threads])]))
+        for instances in instances_list or []:
+            core_sets = split_cores(instances, 1)
+            if core_sets is None:
+                print(f"Skipping {instances} instances: only {len(cores)} cores available")
+                continue
+            points.append(run_packing_point(mode, params, num_iter, core_sets))
+        results.append({"run_mode": mode, "points": points})
+
+    print("\nPacking Summary:")
+    print("-"*50)
+    for result in results:
+        print(f"\nRun Mode: {result['run_mode']}")
+        print(f"  {'Instances':>9} {'Threads':>8} {'Images/s':>9} {'Median lat s':>13} {'Max lat s':>10} {'Total RSS MB':>13}")
+        for p in result["points"]:
+            if p["status"] != "success":
+                print(f"  {p['instances']:>9} {p['threads_per_instance']:>8}   failed")
+                continue
+            print(f"  {p['instances']:>9} {p['threads_per_instance']:>8} {p['images_per_sec']:>9.3f} "
+                  f"{p['latency_median']:>13.2f} {p['latency_max']:>10.2f} {p['total_rss_mb']:>13.0f}")
+        done = [p for p in result["points"] if p["status"] == "success"]
+        if done:
+            best = max(done, key=lambda p: p["images_per_sec"])
+            print(f"  Best throughput: {best['instances']} x {best['threads_per_instance']} threads")
+    return results
+
+def benchmark_compile_cache(run_modes: List[str], params: Dict, cache_dir: str) -> List[Dict]:
+    """
+    Measure restart cost with a cold and a warm persistent compile cache
+
+    For each compiled mode, a fresh process sets up the pipeline and runs the first call with
+    an empty cache directory, then another fresh process does the same with the cache the
+    first one left behind.
+    """
+    results = []
+    for mode in run_modes:
+        if mode == RunMode.EAGER.value:
+            continue
+        mode_cache_dir = os.path.join(cache_dir, mode)
+        shutil.rmtree(mode_cache_dir, ignore_errors=True)
+        os.makedirs(mode_cache_dir)
+        result = {"run_mode": mode, "cache_dir": mode_cache_dir}
+        for state in ("cold", "warm"):
+            print(f"\nFirst call for {mode} with {state} cache in a fresh process...")
+            process, conn = start_mode_process(first_call_worker, mode, dict(params, cache_dir=cache_dir))
+            result[state] = collect_mode_result(mode, process, conn)
+        results.append(result)
+
+    print("\nRestart cost (fresh process: pipeline setup + first call):")
+    print("-"*50)
+    for result in results:
+        print(f"\nRun Mode: {result['run_mode']} (cache: {result['cache_dir']})")
+        for state in ("cold", "warm"):
+            r = result[state]
+            if r["status"] == "success":
+                print(f"  {state.capitalize()} cache: setup {r['setup_time']:.2f} s, first call {r['first_call']:.2f} s, "
+                      f"total {r['setup_time'] + r['first_call']:.2f} s")
+            else:
+                print(f"  {state.capitalize()} cache: failed: {r['error']}")
+        if result["cold"]["status"] == result["warm"]["status"] == "success":
+            print(f"  First call speedup from the cache: {result['cold']['first_call'] / result['warm']['first_call']:.2f}x")
+    return results
+
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    """'768' -> (768, 768), '1024x768' -> (1024, 768) as (height, width)"""
+    height, _, width = value.lower().partition("x")
+    return int(height), int(width or height)
+
+def sweep_worker(conn, run_mode: str, params: Dict, dtype_name: str, resolutions: List[Tuple[int, int]],
+                 steps_list: List[int], num_iter: int):
+    """Subprocess entry point: one mode and dtype over every resolution and step count"""
+    grid = []
+    try:
+        pipe = setup_pipeline(run_mode, params["ckpt"], DTYPES[dtype_name], params.get("cache_dir"),
+                              ov_model_dir=params.get("ov_model_dir"))
+        precision = effective_precision(run_mode, pipe, DTYPES[dtype_name])
+        for (height, width), steps in itertools.product(resolutions, steps_list):
+            point_params = dict(params, height=height, width=width, num_inference_steps=steps)
+            print(f"\n{run_mode} {dtype_name} {height}x{width}, {steps} steps")
+            # A new shape recompiles the compiled modes; warm up every point
+            run_inference(pipe, point_params, iteration=0)
+            times = [run_inference(pipe, point_params, iteration=i + 1)[1] for i in range(num_iter)]
+            grid.append({"run_mode": run_mode, "dtype": dtype_name, "effective_precision": precision,
+                         "height": height, "width": width, "steps": steps,
+                         "median": float(np.median(times)), "min": float(np.min(times))})
+        result = {"run_mode": run_mode, "dtype": dtype_name, "grid": grid, "status": "success"}
+    except Exception as e:
+        print(f"Error during benchmark: {str(e)}")
+        result = {"run_mode": run_mode, "dtype": dtype_name, "grid": grid, "status": "failed", "error": str(e)}
+    conn.send(result)
+    conn.close()
+
+def get_cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return "unknown"
+
+def benchmark_sweep(run_modes: List[str], params: Dict, dtype_names: List[str], resolutions: List[Tuple[int, int]],
+                    steps_list: List[int], num_iter: int) -> List[Dict]:
+    """Median latency for every mode x dtype x resolution x steps, one process per mode and dtype"""
+    grid = []
+    for mode, dtype_name in itertools.product(run_modes, dtype_names):
+        print("\n" + "="*50)
+        print(f"Sweeping run mode: {mode}, dtype: {dtype_name}")
+        print("="*50)
+        process, conn = start_mode_process(sweep_worker, mode, params, dtype_name, resolutions, steps_list, num_iter)
+        result = collect_mode_result(mode, process, conn)
+        if result["status"] != "success":
+            print(f"{mode} {dtype_name} failed: {result['error']}")
+        grid.extend(result.get("grid", []))
+
+    print("\nMedian latency (seconds):")
+    print("-"*50)
+    print(f"{'Run Mode':<12} {'dtype':<5} {'Runs as':>7} {'H x W':>10}" + "".join(f" {f'{s} steps':>9}" for s in steps_list))
+    cells = {(p["run_mode"], p["dtype"], p["height"], p["width"], p["steps"]): p["median"] for p in grid}
+    runs_as = {(p["run_mode"], p["dtype"]): p["effective_precision"] for p in grid}
+    for mode, dtype_name, (height, width) in itertools.product(run_modes, dtype_names, resolutions):
+        row = [cells.get((mode, dtype_name, height, width, s)) for s in steps_list]
+        print(f"{mode:<12} {dtype_name:<5} {runs_as.get((mode, dtype_name), '-'):>7} {f'{height}x{width}':>10}"
+              + "".join(f" {t:>9.2f}" if t is not None else f" {'-':>9}" for t in row))
+
+    print(f"\nFastest dtype per run mode on {get_cpu_model()} (geometric mean over the points every dtype completed; "
+          f"dtypes that did not run in their own precision are left out):")
+    for mode in run_modes:
+        fallback = sorted({f"{d} (ran as {p})" for (m, d), p in runs_as.items()
+                           if m == mode and p != OV_PRECISION_HINTS[DTYPES[d]]})
+        points = {}
+        for p in grid:
+            if p["run_mode"] == mode and p["effective_precision"] == OV_PRECISION_HINTS[DTYPES[p["dtype"]]]:
+                points.setdefault((p["height"], p["width"], p["steps"]), {})[p["dtype"]] = p["median"]
+        completed = [d for d in dtype_names if any(d in v for v in points.values())]
+        shared = [v for v in points.values() if all(d in v for d in completed)]
+        left_out = f"; left out {', '.join(fallback)}" if fallback else ""
+        if not shared:
+            print(f"  {mode}: no results{left_out}")
+            continue
+        geomeans = {d: float(np.exp(np.mean([np.log(v[d]) for v in shared]))) for d in completed}
+        winner = min(geomeans, key=geomeans.get)
+        others = ", ".join(f"{d} {geomeans[d] / geomeans[winner]:.2f}x slower" for d in completed if d != winner)
+        print(f"  {mode}: {winner}" + (f" ({others})" if others else "") + left_out)
+    return grid
+
+def save_sweep(grid: List[Dict], basename: str):
+    """Write the latency grid as JSON and as CSV"""
+    with open(f"{basename}.json", 'w') as f:
+        json.dump(grid, f, indent=2)
+    with open(f"{basename}.csv", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=["run_mode", "dtype", "effective_precision", "height", "width", "steps",
+                                               "median", "min"])
+        writer.writeheader()
+        writer.writerows(grid)
+    print(f"\nSweep saved to {basename}.json and {basename}.csv")
+
 def save_results(results: List[Dict], sw_versions: List[Dict], filename: str = None):
     """Save benchmark results to a JSON file"""
     if filename is None:
@@ -151,7 +792,8 @@ def get_sw_versions():
         ("OpenVINO", "openvino"),
         ("PyTorch", "torch"),
         ("Transformers", "transformers"),
-        ("Diffusers", "diffusers")
+        ("Diffusers", "diffusers"),
+        ("Optimum Intel", "optimum-intel")
     ]
 
     for name, package in packages:
@@ -168,17 +810,40 @@ def main():
     # Parse command-line args
     parser = argparse.ArgumentParser(description='Stable Diffusion Benchmark script')
     parser.add_argument('-ni', '--num_iter', type=int, default=3, help='Number of benchmark iterations')
+    parser.add_argument('--modes', nargs='+', choices=[m.value for m in RunMode], default=[m.value for m in RunMode],
+                        help='Run modes to benchmark (default: all)')
+    parser.add_argument('--ov-model-dir', default='sdxl-lcm-ov',
+                        help='Exported OpenVINO IR for the ov_native mode; exported from the checkpoint if missing')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Run all modes at the same time, each pinned to its own set of cores')
+    parser.add_argument('--min-cores', type=int, default=8,
+                        help='Minimum physical cores per mode for --concurrent (whole cores with their SMT siblings); '
+                        'otherwise modes run one after another')
+    parser.add_argument('--cache-dir', help='Persistent compile cache for the compiled modes '
+                        '(OpenVINO model_caching / inductor FX graph cache), one subdirectory per mode')
+    parser.add_argument('--prompts', help='Prompt file (one per line); runs the batched throughput sweep instead')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4], help='Prompts per call in the throughput sweep')
+    parser.add_argument('--images-per-prompt', type=int, nargs='+', default=[1], help='num_images_per_prompt values in the throughput sweep')
+    parser.add_argument('--num-batches', type=int, default=3, help='Measured calls per throughput config')
+    parser.add_argument('--writers', type=int, default=2, help='Background threads encoding and writing PNGs')
+    parser.add_argument('--output-dir', default='throughput-images', help='Where the throughput sweep writes its images')
+    parser.add_argument('--sweep', action='store_true', help='Sweep resolution, steps and dtype for every run mode')
+    parser.add_argument('--resolutions', nargs='+', default=['512', '768', '1024'], help='Sweep resolutions, H or HxW')
+    parser.add_argument('--steps', type=int, nargs='+', default=[2, 4, 8], help='Sweep num_inference_steps values')
+    parser.add_argument('--dtypes', nargs='+', choices=list(DTYPES), default=list(DTYPES), help='Sweep dtypes')
+    parser.add_argument('--threads-sweep', type=int, nargs='+',
+                        help='Packing study: thread counts for a single pinned instance')
+    parser.add_argument('--instances', type=int, nargs='+',
+                        help='Packing study: numbers of concurrent pinned instances splitting the cores')
+    parser.add_argument('--cache-startup', action='store_true',
+                        help='Only measure setup + first call in fresh processes with a cold, then warm, --cache-dir')
     args = parser.parse_args()
     
     # Number of benchmark iterations
-    num_iter = args.bench_iter
+    num_iter = args.num_iter
 
     # Run modes to test
-    run_modes = [
-        RunMode.EAGER.value,
-        RunMode.TC_INDUCTOR.value,
-        RunMode.TC_OPENVINO.value
-    ]
+    run_modes = args.modes
     
     # Parameters
     params = {
@@ -188,19 +853,80 @@ def main():
         "height": 768,
         "width": 768,
         "prompt": "a close-up picture of an old man standing in the rain",
-        "dtype": torch.float16
+        "dtype": torch.float16,
+        "cache_dir": args.cache_dir,
+        "ov_model_dir": args.ov_model_dir
     }
+
+    if args.cache_startup:
+        if not args.cache_dir:
+            parser.error("--cache-startup needs --cache-dir")
+        results = benchmark_compile_cache(run_modes, params, args.cache_dir)
+        save_results(results, get_sw_versions())
+        return
+
+    if args.threads_sweep or args.instances:
+        results = benchmark_packing(run_modes, params, num_iter, args.threads_sweep, args.instances)
+        save_results(results, get_sw_versions())
+        return
+
+    if args.sweep:
+        grid = benchmark_sweep(run_modes, params, args.dtypes, [parse_resolution(r) for r in args.resolutions],
+                               args.steps, num_iter)
+        save_sweep(grid, f"sweep_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        return
+
+    if args.prompts:
+        prompts = read_prompts(args.prompts)
+        results = []
+        for mode in run_modes:
+            print("\n" + "="*50)
+            print(f"Running throughput sweep with run mode: {mode}, {len(prompts)} prompts")
+            print("="*50)
+            process, conn = start_mode_process(throughput_worker, mode, params, prompts, args.batch_sizes,
+                                               args.images_per_prompt, args.num_batches, args.output_dir, args.writers)
+            results.append(collect_mode_result(mode, process, conn))
+        save_results(results, get_sw_versions())
+
+        print("\nThroughput Summary:")
+        print("-"*50)
+        for result in results:
+            print(f"\nRun Mode: {result['run_mode']}")
+            if result["status"] != "success":
+                print(f"  Status: Failed")
+                print(f"  Error: {result['error']}")
+                continue
+            print(f"  {'Batch':>5} {'Img/prompt':>10} {'Images/s':>9} {'Gen only':>9} {'Peak RSS MB':>12}")
+            for r in result["throughput"]:
+                print(f"  {r['batch_size']:>5} {r['num_images_per_prompt']:>10} {r['images_per_sec']:>9.3f} "
+                      f"{r['generate_images_per_sec']:>9.3f} {r['peak_rss_mb']:>12.0f}")
+            best = max(result["throughput"], key=lambda r: r["images_per_sec"])
+            print(f"  Best: batch {best['batch_size']} x {best['num_images_per_prompt']} at {best['images_per_sec']:.3f} images/sec")
+        return
     
-    # Run benchmarks
+    # Run benchmarks, each mode in its own process
+    core_sets = split_cores(len(run_modes), args.min_cores) if args.concurrent else None
+    if args.concurrent and core_sets is None:
+        print(f"Not enough cores for {len(run_modes)} modes with {args.min_cores} physical cores each "
+              f"(only {len(read_cpu_topology())} available); running them one after another")
+
     results = []
-    for mode in run_modes:
-        print("\n" + "="*50)
-        print(f"Running benchmark with run mode: {mode}")
-        print(f"Number of iterations: {num_iter}")
-        print("="*50)
-        
-        result = run_benchmark(mode, params, num_iter)
-        results.append(result)
+    if core_sets:
+        print(f"\nRunning {len(run_modes)} modes concurrently on disjoint physical cores: "
+              f"{', '.join(f'{m} on {format_cpu_list(c)}' for m, c in zip(run_modes, core_sets))}")
+        processes = [start_mode_process(run_mode_worker, mode, params, num_iter, cores) for mode, cores in zip(run_modes, core_sets)]
+        for mode, (process, conn) in zip(run_modes, processes):
+            results.append(collect_mode_result(mode, process, conn))
+    else:
+        for mode in run_modes:
+            print("\n" + "="*50)
+            print(f"Running benchmark with run mode: {mode}")
+            print(f"Number of iterations: {num_iter}")
+            print("="*50)
+            
+            process, conn = start_mode_process(run_mode_worker, mode, params, num_iter)
+            result = collect_mode_result(mode, process, conn)
+            results.append(result)
     
     sw_versions = get_sw_versions()
     print("\nSoftware Versions:")
@@ -217,6 +943,9 @@ def main():
     for result in results:
         if result["status"] == "success":
             print(f"\nRun Mode: {result['run_mode']}")
+            requested = OV_PRECISION_HINTS[params["dtype"]]
+            print(f"  Effective precision: {result['effective_precision']}"
+                  + (f" (requested {requested})" if result["effective_precision"] != requested else ""))
             print(f"  Warm-up Time: {result['warmup_time']:.2f} seconds")
             print(f"  Average Time: {result['statistics']['mean']:.2f} seconds")
             print(f"  Median Time: {result['statistics']['median']:.2f} seconds")
@@ -227,6 +956,13 @@ def main():
             print(f"  95th Percentile: {result['statistics']['percentile_95']:.2f} seconds")
             print(f"  Warm-up image saved as: {result['warmup_image']}")
             print(f"  Final image saved as: {result['final_image']}")
+            print(f"  Peak RSS: {result['peak_rss_mb']:.0f} MB")
+            print(f"  {'Component':<16} {'Calls':>6} {'Median ms':>10} {'P95 ms':>10} {'Total s':>8}")
+            for name, comp in result["components"].items():
+                print(f"  {name:<16} {comp['calls']:>6} {comp['median'] * 1000:>10.1f} "
+                      f"{comp['percentile_95'] * 1000:>10.1f} {comp['total']:>8.2f}")
+            if "cores" in result:
+                print(f"  Cores: {result['cores']}")
         else:
             print(f"\nRun Mode: {result['run_mode']}")
             print(f"  Status: Failed")
@@ -236,3 +972,15 @@ if __name__ == "__main__":
     main()
 
 # Usage: python torchcompile-sdxl-lcm-benchmark.py -ni 3
+# Each run mode runs in its own process; on a large host, run them side by side on disjoint cores:
+# python torchcompile-sdxl-lcm-benchmark.py -ni 3 --concurrent --min-cores 16
+# Restart cost of the compiled modes with a cold and a warm persistent compile cache:
+# python torchcompile-sdxl-lcm-benchmark.py --cache-dir ./compile-cache --cache-startup
+# Batched throughput over a prompt file, PNGs written by a background thread pool:
+# python torchcompile-sdxl-lcm-benchmark.py --prompts prompts.txt --batch-sizes 1 2 4 8 --images-per-prompt 1 2
+# Threads for one pinned instance, then 1, 2, 4 pinned instances splitting the cores:
+# python torchcompile-sdxl-lcm-benchmark.py --threads-sweep 8 16 32 --instances 1 2 4 -ni 3
+# Latency grid over resolution, steps and dtype, saved as JSON and CSV:
+# python torchcompile-sdxl-lcm-benchmark.py --sweep --resolutions 512 768 1024x768 --steps 2 4 8 --dtypes fp32 bf16 fp16 -ni 2
+# Per-phase CPU and memory under utils/cpu-mem-profiler.py; -t because every mode runs in a child process:
+# python ../utils/cpu-mem-profiler.py -p "python torchcompile-sdxl-lcm-benchmark.py -ni 3" -e proc -i 0.1 -t
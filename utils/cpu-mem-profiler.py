@@ -1,12 +1,66 @@
 '''
 Example Usage:
- 
+
 python cpu-mem-profiler.py -p "python my-script.py -n 'myarg' "
 
 To print memory usage in GB and interval of 0.5 seconds:
 python cpu-mem-profiler.py -p "python my-script.py -n 'myarg' " -m GB -i 0.5
 
+To include all child and grandchild processes (torch.compile workers, OVMS, mpirun, ...):
+python cpu-mem-profiler.py -p "mpirun -n 4 python train.py" --tree
+
+To sample every 2 ms with the low-overhead /proc engine (Linux only):
+python cpu-mem-profiler.py -p "python my-script.py" -e proc -i 0.002
+
+To stream every sample to a file (constant profiler memory for multi-hour soak runs):
+python cpu-mem-profiler.py -p "python serve.py" -e proc -i 0.01 -o samples.jsonl
+
+To also collect PSS/USS/swap, page faults, context switches, per-thread CPU and I/O, and
+get a hint about the likely bottleneck (memory-bound load, I/O-bound load, oversubscription):
+python cpu-mem-profiler.py -p "python my-script.py" -e proc -x
+
+To get duration, peak memory and average CPU per phase, mark the phases in the program
+(see profiler_phases.py; the markers are no-ops when not run under this profiler):
+    from profiler_phases import phase
+    with phase("compile"):
+        ...
+If the phases run in child processes (subprocess, multiprocessing), add -t so the
+samples include them.
+
+To decide whether a change really helps, run two or more programs for 20 rounds in
+randomized interleaved order and compare duration, peak memory and CPU (medians, 95%
+confidence intervals and a Mann-Whitney U test against the first program):
+python cpu-mem-profiler.py -c "python bench.py --threads 8" "python bench.py --threads 16" -r 20 -i 0.05 -t
+
+To report Intel GPU and NPU busy % and frequency next to the program's CPU and memory
+(same sysfs readers as openvino/install-gpu-npu-drivers/print_cpu_gpu_npu_usage.sh):
+python cpu-mem-profiler.py -p "python test-npu-cache-perf.py" -d gpu npu -i 0.1 -o samples.csv -t
+
+To find how many instances to pack per host, run a program under a sweep of CPU sets
+(1, 2, 4 ... N cores, each socket, SMT off and on) and NUMA memory policies, and report
+wall time, CPU, peak memory, speedup and parallel efficiency per point:
+python cpu-mem-profiler.py -p "python bench.py" --sweep -r 3 -t --sweep-numa none bind --sweep-set-threads
+
+To measure the profiler's own CPU cost at several intervals:
+python cpu-mem-profiler.py --bench-overhead -e proc
+python cpu-mem-profiler.py --bench-overhead -e psutil --bench-intervals 0.001 0.01 0.1
+
 memory_info().rss: returns the resident set size, which is the non-swapped physical memory a process has used (in bytes).
+
+In --tree mode the process tree is re-discovered on every sample, so workers that are
+started and stopped while the program runs are picked up. Processes that live for less
+than one interval can be missed; lower -i to catch them.
+
+Sampling engines:
+  psutil: portable, one psutil.Process kept per pid.
+  proc:   keeps /proc/<pid>/stat and statm open and re-reads them with os.pread(), so a
+          sample costs a couple of syscalls per process. CPU is computed from utime+stime
+          deltas over a window of at least 0.1 sec (utime/stime only advance in clock
+          ticks), so the sampling period is independent of the CPU measurement window
+          and RSS spikes are still caught at the full sample rate.
+Samples are taken on a fixed schedule. When a sample takes longer than the interval the
+profiler sleeps at least as long as the sample took, which caps its own cost at about
+half of one core no matter how small -i is.
 '''
 
 import psutil
@@ -14,64 +68,1329 @@ import subprocess
 import time
 import argparse
 import shlex
+import os
+import csv
+import json
+import tempfile
+import math
+import random
+import re
+import shutil
+from collections import deque
 
-def monitor_program(program, memory_unit='MB', interval=1):
-    # Split the program string into arguments
-    program_args = shlex.split(program)
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def get_process_tree(root):
+    """Return the root process followed by all of its live descendants."""
+    try:
+        return [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+EXTENDED_COUNTERS = ['minflt', 'majflt', 'vol_ctx', 'invol_ctx', 'read_bytes', 'write_bytes']
+
+def read_page_faults(pid):
+    """Return (minor, major) page faults of `pid` from /proc, or (0, 0) where that is not available."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            fields = f.read().rsplit(b')', 1)[1].split()
+        return int(fields[7]), int(fields[9])
+    except (OSError, IndexError, ValueError):
+        return 0, 0
+
+class PsutilSampler:
+    """Samples a process (or process tree) through psutil."""
+
+    def __init__(self, root_pid, tree=False, extended=False):
+        self.root = psutil.Process(root_pid)
+        self.tree = tree
+        self.extended = extended
+        self.num_cpus = psutil.cpu_count()
+        # Keep one psutil.Process per pid so cpu_percent() can measure against its previous call
+        self.tracked = {}
+        self._discover()
+
+    def _discover(self):
+        # Pick up processes started since the last sample and prime their CPU counters
+        procs = get_process_tree(self.root) if self.tree else [self.root]
+        for p in procs:
+            if p.pid not in self.tracked:
+                try:
+                    p.cpu_percent(interval=None)
+                    self.tracked[p.pid] = p
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+
+    def _sample_extended(self, p, s):
+        mem = p.memory_full_info()
+        ctx = p.num_ctx_switches()
+        s.update(uss=mem.uss, pss=mem.pss, swap=mem.swap, vol_ctx=ctx.voluntary, invol_ctx=ctx.involuntary)
+        s['minflt'], s['majflt'] = read_page_faults(p.pid)
+        try:
+            io = p.io_counters()
+            s['read_bytes'], s['write_bytes'] = io.read_bytes, io.write_bytes
+        except (psutil.AccessDenied, AttributeError):
+            s['read_bytes'], s['write_bytes'] = 0, 0
+        threads = p.threads()
+        s['num_threads'] = len(threads)
+        s['threads'] = {t.id: (s['name'], t.user_time + t.system_time) for t in threads}
+
+    def sample(self):
+        """Return a list of {'pid', 'name', 'cpu', 'rss'} dicts, one per live process.
+
+        With extended=True the dicts also carry 'uss', 'pss', 'swap', 'num_threads',
+        the cumulative EXTENDED_COUNTERS and 'threads' ({tid: (name, cpu seconds)}).
+        """
+        samples = []
+        for pid, p in list(self.tracked.items()):
+            try:
+                with p.oneshot():
+                    s = {
+                        'pid': pid,
+                        'name': p.name(),
+                        'cpu': p.cpu_percent(interval=None) / self.num_cpus,
+                        'rss': p.memory_info().rss,
+                    }
+                    if self.extended:
+                        self._sample_extended(p, s)
+                    samples.append(s)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess, psutil.AccessDenied):
+                # The process exited during the interval; its stats so far are kept
+                del self.tracked[pid]
+        self._discover()
+        return samples
+
+    def close(self):
+        self.tracked.clear()
+
+class ProcFiles:
+    """The /proc/<pid> files of one process, opened once and re-read with os.pread()."""
+
+    def __init__(self, pid, boot_offset, cpu_window, extended=False):
+        self.pid = pid
+        self.fds = []
+        try:
+            self.stat_fd = self._open('stat')
+            self.statm_fd = self._open('statm')
+            if extended:
+                self.smaps_fd = self._open('smaps_rollup')
+                self.status_fd = self._open('status')
+                # /proc/<pid>/io needs ptrace access; children of the profiler are fine
+                try:
+                    self.io_fd = self._open('io')
+                except PermissionError:
+                    self.io_fd = None
+        except OSError:
+            self.close()
+            raise
+        self.prev_ticks = 0
+        self.prev_time = None
+        self.cpu = 0
+        self.boot_offset = boot_offset
+        self.cpu_window = cpu_window
+
+    def _open(self, name):
+        fd = os.open(f'/proc/{self.pid}/{name}', os.O_RDONLY)
+        self.fds.append(fd)
+        return fd
+
+    def read_stat(self):
+        """Return (name, utime+stime ticks, start time, stat fields), or None if the process has exited.
+
+        The stat fields start at field 3 (state), so field N of proc(5) is fields[N - 3].
+        """
+        data = os.pread(self.stat_fd, 4096, 0)
+        # comm may contain spaces and parentheses, so split on the last ')'
+        lparen = data.index(b'(')
+        rparen = data.rindex(b')')
+        fields = data[rparen + 2:].split()
+        state = fields[0]
+        if state in (b'Z', b'X'):
+            return None
+        ticks = int(fields[11]) + int(fields[12])
+        start = self.boot_offset + int(fields[19]) / CLK_TCK
+        return data[lparen + 1:rparen].decode(errors='replace'), ticks, start, fields
+
+    def read_rss(self):
+        return int(os.pread(self.statm_fd, 256, 0).split()[1]) * PAGE_SIZE
+
+    def update_cpu(self, ticks, start, now):
+        """Return CPU usage in percent of one core over the last completed CPU window."""
+        # The first sample of a process covers its whole life so far, so short-lived
+        # workers still get a meaningful CPU figure
+        prev_time = self.prev_time if self.prev_time is not None else start
+        elapsed = now - prev_time
+        if self.prev_time is None or elapsed >= self.cpu_window:
+            if elapsed > 0:
+                self.cpu = (ticks - self.prev_ticks) / CLK_TCK / elapsed * 100
+            self.prev_ticks = ticks
+            self.prev_time = now
+        return self.cpu
+
+    def read_extended(self, fields, s):
+        """Add smaps_rollup, status, io and per-thread metrics to the sample dict `s`."""
+        s['minflt'] = int(fields[7])
+        s['majflt'] = int(fields[9])
+        s['num_threads'] = int(fields[17])
+
+        # smaps_rollup walks every mapping, so it is the most expensive read here
+        rollup = parse_kb_fields(os.pread(self.smaps_fd, 4096, 0))
+        s['pss'] = rollup.get(b'Pss', 0)
+        s['uss'] = rollup.get(b'Private_Clean', 0) + rollup.get(b'Private_Dirty', 0)
+        s['swap'] = rollup.get(b'Swap', 0)
+
+        status = parse_kb_fields(os.pread(self.status_fd, 8192, 0))
+        s['vol_ctx'] = status.get(b'voluntary_ctxt_switches', 0)
+        s['invol_ctx'] = status.get(b'nonvoluntary_ctxt_switches', 0)
+
+        s['read_bytes'] = s['write_bytes'] = 0
+        if self.io_fd is not None:
+            for line in os.pread(self.io_fd, 1024, 0).splitlines():
+                key, _, value = line.partition(b':')
+                if key in (b'read_bytes', b'write_bytes'):
+                    s[key.decode()] = int(value)
+
+        s['threads'] = {}
+        for tid in os.listdir(f'/proc/{self.pid}/task'):
+            try:
+                with open(f'/proc/{self.pid}/task/{tid}/stat', 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue  # The thread exited while listing
+            rparen = data.rindex(b')')
+            fields = data[rparen + 2:].split()
+            name = data[data.index(b'(') + 1:rparen].decode(errors='replace')
+            s['threads'][int(tid)] = (name, (int(fields[11]) + int(fields[12])) / CLK_TCK)
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+def parse_kb_fields(data):
+    """Parse 'Key:   value [kB]' lines from smaps_rollup or status into {key: int}, kB in bytes."""
+    values = {}
+    for line in data.splitlines():
+        key, _, rest = line.partition(b':')
+        parts = rest.split()
+        if len(parts) == 2 and parts[1] == b'kB':
+            values[key] = int(parts[0]) * 1024
+        elif len(parts) == 1 and parts[0].isdigit():
+            values[key] = int(parts[0])
+    return values
+
+class ProcSampler:
+    """Samples a process (or process tree) by pread()-ing /proc files kept open between samples."""
+
+    def __init__(self, root_pid, tree=False, extended=False, cpu_window=0.1):
+        self.root_pid = root_pid
+        self.tree = tree
+        self.extended = extended
+        self.cpu_window = cpu_window
+        self.num_cpus = os.cpu_count()
+        self.has_children_file = os.path.exists(f'/proc/{root_pid}/task/{root_pid}/children')
+        # perf_counter() value at boot, used to turn /proc start times into perf_counter() times
+        with open('/proc/uptime') as f:
+            self.boot_offset = time.perf_counter() - float(f.read().split()[0])
+        self.tracked = {}
+
+    def _children(self, pid):
+        if not self.has_children_file:
+            try:
+                return [c.pid for c in psutil.Process(pid).children()]
+            except psutil.NoSuchProcess:
+                return []
+        children = []
+        try:
+            for tid in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{tid}/children', 'rb') as f:
+                    children.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+        return children
+
+    def _discover(self):
+        pids = [self.root_pid]
+        if self.tree:
+            i = 0
+            while i < len(pids):
+                pids.extend(self._children(pids[i]))
+                i += 1
+        for pid in pids:
+            if pid not in self.tracked:
+                try:
+                    self.tracked[pid] = ProcFiles(pid, self.boot_offset, self.cpu_window, self.extended)
+                except OSError:
+                    pass
+
+    def _drop(self, pid):
+        self.tracked.pop(pid).close()
+
+    def sample(self):
+        """Return a list of {'pid', 'name', 'cpu', 'rss'} dicts, one per live process.
+
+        With extended=True the dicts carry the same extra keys as PsutilSampler.sample().
+        """
+        self._discover()
+        samples = []
+        for pid, pf in list(self.tracked.items()):
+            try:
+                now = time.perf_counter()
+                stat = pf.read_stat()
+                if stat is None:
+                    self._drop(pid)
+                    continue
+                name, ticks, start, fields = stat
+                s = {'pid': pid, 'name': name, 'cpu': pf.update_cpu(ticks, start, now) / self.num_cpus,
+                     'rss': pf.read_rss()}
+                if self.extended:
+                    pf.read_extended(fields, s)
+            except (OSError, ValueError, IndexError):
+                # The process exited during the interval; its stats so far are kept
+                self._drop(pid)
+                continue
+            samples.append(s)
+        return samples
+
+    def close(self):
+        for pid in list(self.tracked):
+            self._drop(pid)
+
+SAMPLERS = {
+    'psutil': PsutilSampler,
+    'proc': ProcSampler,
+}
+
+class SysfsFile:
+    """A sysfs attribute opened once and re-read with os.pread(); reads return None if it is missing."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            self.fd = None
+
+    def read_int(self):
+        if self.fd is None:
+            return None
+        try:
+            return int(os.pread(self.fd, 64, 0).split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class GpuSampler:
+    """Intel GPU busy % and frequency from the xe or i915 sysfs interface.
+
+    Ported from openvino/install-gpu-npu-drivers/print_cpu_gpu_npu_usage.sh: the first
+    /sys/class/drm/cardN with an xe (tile0/gt0) or i915 (engine/rcs0) layout is used.
+    xe reports idle residency (busy = 100% - idle%), i915 reports rcs0 busy time.
+    """
+
+    fields = ['gpu_busy', 'gpu_freq']
+
+    def __init__(self, sysfs_root='/sys'):
+        self.card = None
+        self.method = None
+        self.counter = None
+        self.freq = None
+        drm = os.path.join(sysfs_root, 'class', 'drm')
+        cards = sorted(os.listdir(drm), key=lambda c: int(c[4:]) if re.fullmatch(r'card\d+', c) else -1) \
+            if os.path.isdir(drm) else []
+        for card in cards:
+            # Skip connector entries like card1-DP-1
+            if not re.fullmatch(r'card\d+', card):
+                continue
+            card_path = os.path.join(drm, card)
+            idle_path = os.path.join(card_path, 'device', 'tile0', 'gt0', 'gtidle', 'idle_residency_ms')
+            engine_path = os.path.join(card_path, 'engine', 'rcs0', 'busy_time_ns')
+            if os.path.isfile(idle_path):
+                self.method, self.counter = 'xe_idle', SysfsFile(idle_path)
+            elif os.path.isfile(engine_path):
+                self.method, self.counter = 'i915_engine', SysfsFile(engine_path)
+            elif not os.path.isfile(os.path.join(card_path, 'gt_cur_freq_mhz')):
+                continue
+            self.card = card
+            for freq_path in [os.path.join(card_path, 'device', 'tile0', 'gt0', 'freq0', 'cur_freq'),
+                              os.path.join(card_path, 'gt_cur_freq_mhz')]:
+                if os.path.isfile(freq_path):
+                    self.freq = SysfsFile(freq_path)
+                    break
+            break
+        self.available = self.card is not None
+        self.prev = self.counter.read_int() if self.counter else None
+        self.prev_time = time.perf_counter()
+
+    def sample(self):
+        """Return {'gpu_busy': percent, 'gpu_freq': MHz} since the previous call; None where unknown."""
+        now = time.perf_counter()
+        elapsed, self.prev_time = now - self.prev_time, now
+        busy = None
+        value = self.counter.read_int() if self.counter else None
+        if value is not None and self.prev is not None and elapsed > 0:
+            if self.method == 'xe_idle':
+                busy = 100 - (value - self.prev) / (elapsed * 1000) * 100
+            else:
+                busy = (value - self.prev) / (elapsed * 1e9) * 100
+            busy = round(min(max(busy, 0), 100), 2)
+        self.prev = value
+        return {'gpu_busy': busy, 'gpu_freq': self.freq.read_int() if self.freq else None}
+
+    def describe(self):
+        return f"GPU: {self.card} ({self.method or 'frequency only'})" if self.available else "GPU: not found"
+
+    def close(self):
+        for f in (self.counter, self.freq):
+            if f:
+                f.close()
+
+class NpuSampler:
+    """Intel NPU busy %, frequency and memory from /sys/class/accel/accel0/device."""
+
+    fields = ['npu_busy', 'npu_freq', 'npu_mem']
+
+    def __init__(self, sysfs_root='/sys'):
+        device = os.path.join(sysfs_root, 'class', 'accel', 'accel0', 'device')
+        self.available = os.path.isfile(os.path.join(device, 'npu_busy_time_us'))
+        self.busy = SysfsFile(os.path.join(device, 'npu_busy_time_us'))
+        self.freq = SysfsFile(os.path.join(device, 'npu_current_frequency_mhz'))
+        self.mem = SysfsFile(os.path.join(device, 'npu_memory_utilization'))
+        self.prev = self.busy.read_int()
+        self.prev_time = time.perf_counter()
+
+    def sample(self):
+        """Return {'npu_busy': percent, 'npu_freq': MHz, 'npu_mem': bytes}; None where unknown."""
+        now = time.perf_counter()
+        elapsed, self.prev_time = now - self.prev_time, now
+        busy = None
+        value = self.busy.read_int()
+        if value is not None and self.prev is not None and elapsed > 0:
+            busy = round(min(max((value - self.prev) / (elapsed * 1e6) * 100, 0), 100), 2)
+        self.prev = value
+        return {'npu_busy': busy, 'npu_freq': self.freq.read_int(), 'npu_mem': self.mem.read_int()}
+
+    def describe(self):
+        return "NPU: accel0" if self.available else "NPU: not found"
+
+    def close(self):
+        for f in (self.busy, self.freq, self.mem):
+            f.close()
+
+DEVICE_SAMPLERS = {
+    'gpu': GpuSampler,
+    'npu': NpuSampler,
+}
+
+class P2Quantile:
+    """Streaming estimate of one quantile in constant memory (Jain & Chlamtac P-square algorithm)."""
+
+    def __init__(self, q):
+        self.q = q
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x):
+        h = self.heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+
+        # Find the cell containing x, extending the extreme markers if needed
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < height < h[i + 1]:
+                    height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = height
+                n[i] += d
+
+    def value(self):
+        h = self.heights
+        if not h:
+            return 0
+        if self.positions[4] > 5:
+            return h[2]
+        # Fewer than 6 samples: the markers are the sorted samples themselves
+        return h[round(self.q * (len(h) - 1))]
+
+class StreamingQuantiles:
+    """A set of P2Quantile estimators for the same stream, e.g. p50/p95/p99."""
+
+    def __init__(self, percentiles=(50, 95, 99)):
+        self.estimators = {p: P2Quantile(p / 100) for p in percentiles}
+
+    def add(self, x):
+        for e in self.estimators.values():
+            e.add(x)
+
+    def values(self):
+        return {p: e.value() for p, e in self.estimators.items()}
+
+class SampleSink:
+    """Streams aggregate samples to a CSV or JSONL file as they are taken."""
+
+    def __init__(self, path, fmt=None, flush_interval=1.0):
+        self.path = path
+        self.fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        self.file = open(path, 'w', newline='')
+        self.writer = None
+        self.flush_interval = flush_interval
+        self.last_flush = time.perf_counter()
+
+    def write(self, row):
+        if self.fmt == 'jsonl':
+            self.file.write(json.dumps(row) + '\n')
+        else:
+            if self.writer is None:
+                # The first row defines the columns
+                self.writer = csv.DictWriter(self.file, fieldnames=list(row), extrasaction='ignore')
+                self.writer.writeheader()
+            self.writer.writerow(row)
+
+        # Flush periodically so a killed soak run still leaves a usable file
+        now = time.perf_counter()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+class ExtendedStats:
+    """Aggregates the extended metrics (PSS/USS, faults, context switches, I/O, threads) of a run."""
 
-    # Start the program
-    process = subprocess.Popen(program_args)
+    GAUGES = ['pss', 'uss', 'swap', 'num_threads']
 
+    def __init__(self):
+        self.peak = dict.fromkeys(self.GAUGES, 0)
+        self.peak_rate = dict.fromkeys(EXTENDED_COUNTERS, 0)
+        # Last cumulative counter values per pid, so exited processes still count in the totals
+        self.last_counters = {}
+        # (pid, tid) -> (name, cpu seconds)
+        self.threads = {}
+        self.prev_time = None
+
+    def update(self, samples, now):
+        """Fold one set of samples into the totals and return its aggregate fields.
+
+        Gauges are summed over the tree; counters are returned as deltas since the last sample.
+        """
+        row = dict.fromkeys(self.GAUGES + EXTENDED_COUNTERS, 0)
+        for s in samples:
+            for k in self.GAUGES:
+                row[k] += s[k]
+            last = self.last_counters.setdefault(s['pid'], dict.fromkeys(EXTENDED_COUNTERS, 0))
+            for c in EXTENDED_COUNTERS:
+                row[c] += s[c] - last[c]
+                last[c] = s[c]
+            for tid, thread in s['threads'].items():
+                self.threads[(s['pid'], tid)] = thread
+
+        for k in self.GAUGES:
+            self.peak[k] = max(self.peak[k], row[k])
+        # The first sample's deltas cover everything since process start, so they are no rate
+        if self.prev_time is not None and now > self.prev_time:
+            for c in EXTENDED_COUNTERS:
+                self.peak_rate[c] = max(self.peak_rate[c], row[c] / (now - self.prev_time))
+        self.prev_time = now
+        return row
+
+    def totals(self):
+        return {c: sum(last[c] for last in self.last_counters.values()) for c in EXTENDED_COUNTERS}
+
+    def summary(self):
+        return {
+            'peak': dict(self.peak),
+            'peak_rate': dict(self.peak_rate),
+            'totals': self.totals(),
+            'threads': sorted(((pid, tid, name, cpu) for (pid, tid), (name, cpu) in self.threads.items()),
+                              key=lambda t: t[3], reverse=True),
+        }
+
+def diagnose(stats, num_cpus):
+    """Return hints about the likely bottleneck of a run profiled with extended metrics."""
+    ext = stats['extended']
+    totals = ext['totals']
+    duration = max(stats['duration'], 1e-9)
+    avg_cores = stats['average_cpu'] * num_cpus / 100
+    hints = []
+
+    # Major faults mean pages come from disk on first touch, e.g. mmapped weight files;
+    # a high minor fault rate means time goes into populating freshly mapped memory
+    if totals['majflt'] / duration > 50 or ext['peak_rate']['majflt'] > 500:
+        hints.append(f"Memory-bound load: {totals['majflt']} major page faults (peak {ext['peak_rate']['majflt']:.0f}/s); "
+                     "model pages are being faulted in from disk")
+    if ext['peak_rate']['minflt'] > 100000:
+        hints.append(f"Memory-bound load: minor page faults peak at {ext['peak_rate']['minflt']:.0f}/s "
+                     "(first touch of newly allocated or mapped memory)")
+
+    read_mb_per_sec = totals['read_bytes'] / duration / (1024 * 1024)
+    if read_mb_per_sec > 50 and avg_cores < 1:
+        hints.append(f"I/O-bound load: reading {read_mb_per_sec:.0f} MB/s from storage "
+                     f"while using only {avg_cores:.2f} cores on average")
+
+    ctx_total = totals['vol_ctx'] + totals['invol_ctx']
+    invol_ratio = totals['invol_ctx'] / ctx_total if ctx_total else 0
+    if ext['peak']['num_threads'] > num_cpus and invol_ratio > 0.2:
+        hints.append(f"Oversubscribed threads: up to {ext['peak']['num_threads']} threads on {num_cpus} CPUs, "
+                     f"{invol_ratio * 100:.0f}% of context switches involuntary; "
+                     "limit OMP_NUM_THREADS / INFERENCE_NUM_THREADS or the number of workers")
+
+    if ext['peak']['swap'] > 0:
+        hints.append(f"Memory pressure: up to {ext['peak']['swap'] / (1024 * 1024):.0f} MB swapped out")
+
+    if ext['peak']['pss'] and stats['peak_memory'] > 1.2 * ext['peak']['pss']:
+        hints.append(f"Shared pages: peak RSS is {stats['peak_memory'] / ext['peak']['pss']:.1f}x peak PSS, "
+                     "so RSS double-counts shared mappings; size hosts by PSS")
+    return hints
+
+def print_extended(stats, memory_unit, memory_factor, num_cpus, top_threads=10):
+    """Print the extended metrics, the busiest threads and the bottleneck hints."""
+    ext = stats['extended']
+    totals = ext['totals']
+    mb = 1024 * 1024
+    print("\nExtended metrics:")
+    print(f"Peak PSS: {ext['peak']['pss'] / memory_factor:.2f} {memory_unit} | "
+          f"Peak USS: {ext['peak']['uss'] / memory_factor:.2f} {memory_unit} | "
+          f"Peak Swap: {ext['peak']['swap'] / memory_factor:.2f} {memory_unit}")
+    print(f"Page faults: {totals['minflt']} minor (peak {ext['peak_rate']['minflt']:.0f}/s), "
+          f"{totals['majflt']} major (peak {ext['peak_rate']['majflt']:.0f}/s)")
+    print(f"Context switches: {totals['vol_ctx']} voluntary, {totals['invol_ctx']} involuntary | "
+          f"Peak threads: {ext['peak']['num_threads']}")
+    print(f"I/O: {totals['read_bytes'] / mb:.2f} MB read (peak {ext['peak_rate']['read_bytes'] / mb:.2f} MB/s), "
+          f"{totals['write_bytes'] / mb:.2f} MB written (peak {ext['peak_rate']['write_bytes'] / mb:.2f} MB/s)")
+
+    threads = ext['threads'][:top_threads]
+    if threads:
+        print(f"\nBusiest threads (top {len(threads)} of {len(ext['threads'])}):")
+        print(f"{'PID':>8} {'TID':>8} {'Name':<20} {'CPU time':>10} {'Avg CPU':>9}")
+        print("-" * 59)
+        for pid, tid, name, cpu in threads:
+            print(f"{pid:>8} {tid:>8} {name[:20]:<20} {cpu:>8.2f} s {cpu / stats['duration'] * 100:>8.2f}%")
+
+    print("\nLikely bottlenecks:")
+    for hint in diagnose(stats, num_cpus) or ["No obvious bottleneck detected"]:
+        print(f"  - {hint}")
+
+class PhaseTracker:
+    """Reads phase markers sent by profiler_phases.py through a FIFO and attributes samples to phases."""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix='cpu-mem-profiler-')
+        self.path = os.path.join(self.dir, 'phases')
+        os.mkfifo(self.path)
+        self.read_fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        # Hold a write end open so the FIFO does not report EOF whenever a writer closes it
+        self.hold_fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        self.buffer = b''
+        self.wall_start = time.time()
+        # (pid, phase) -> begin time, so the same phase can run in several processes at once
+        self.active = {}
+        self.phases = {}
+        self.untracked_pids = set()
+
+    def env(self):
+        """Environment for the profiled program so it can `from profiler_phases import phase`."""
+        here = os.path.dirname(os.path.abspath(__file__))
+        pythonpath = os.environ.get('PYTHONPATH')
+        return dict(os.environ, CPU_MEM_PROFILER_PHASES=self.path,
+                    PYTHONPATH=here + os.pathsep + pythonpath if pythonpath else here)
+
+    def poll(self, sampled_pids=None):
+        """Apply all markers received since the last call.
+
+        `sampled_pids` is the set of pids the sampler measures, or None when it follows the
+        whole process tree. A marker from any other pid (e.g. a multiprocessing child) is still
+        applied, but that process's CPU and memory are not in the samples, so warn once per pid.
+        """
+        while True:
+            try:
+                data = os.read(self.read_fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        for line in lines:
+            try:
+                m = json.loads(line)
+            except ValueError:
+                continue
+            if sampled_pids is not None and m['pid'] not in sampled_pids and m['pid'] not in self.untracked_pids:
+                self.untracked_pids.add(m['pid'])
+                print(f"Warning: phase '{m['phase']}' was marked by pid {m['pid']}, which is not being sampled; "
+                      f"its CPU and memory are missing from the phase stats. Use -t to sample the whole process tree.")
+            t = m['time'] - self.wall_start
+            key = (m['pid'], m['phase'])
+            if m['event'] == 'begin':
+                p = self.phases.setdefault(m['phase'], {'first_begin': t, 'count': 0, 'duration': 0, 'samples': 0,
+                                                        'cpu_sum': 0, 'peak_cpu': 0, 'peak_memory': 0})
+                p['count'] += 1
+                self.active[key] = t
+            elif key in self.active:
+                self.phases[m['phase']]['duration'] += t - self.active.pop(key)
+
+    def active_phases(self):
+        return sorted({name for _, name in self.active})
+
+    def attribute(self, cpu, memory):
+        """Count one aggregate sample towards every phase that is currently active."""
+        for name in self.active_phases():
+            p = self.phases[name]
+            p['samples'] += 1
+            p['cpu_sum'] += cpu
+            p['peak_cpu'] = max(p['peak_cpu'], cpu)
+            p['peak_memory'] = max(p['peak_memory'], memory)
+
+    def summary(self):
+        """Close phases that never ended at the current time and return the per-phase stats."""
+        self.poll()
+        now = time.time() - self.wall_start
+        for (pid, name), begin in self.active.items():
+            self.phases[name]['duration'] += now - begin
+        self.active = {}
+        return dict(sorted(self.phases.items(), key=lambda item: item[1]['first_begin']))
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.hold_fd)
+        os.unlink(self.path)
+        os.rmdir(self.dir)
+
+def print_phase_table(phases, memory_unit, memory_factor):
+    """Print per-phase duration, peak memory and CPU from PhaseTracker.summary()."""
+    print(f"\nPer-phase usage ({len(phases)} phases):")
+    print(f"{'Phase':<30} {'Count':>6} {'Duration':>10} {'Samples':>8} {'Peak Mem':>12} {'Avg CPU':>9} {'Peak CPU':>9}")
+    print("-" * 90)
+    for name, p in phases.items():
+        if p['samples']:
+            usage = (f"{p['peak_memory'] / memory_factor:>9.2f} {memory_unit} "
+                     f"{p['cpu_sum'] / p['samples']:>8.2f}% {p['peak_cpu']:>8.2f}%")
+        else:
+            # The phase was shorter than the sampling interval
+            usage = f"{'-':>12} {'-':>9} {'-':>9}"
+        print(f"{name[:30]:<30} {p['count']:>6} {p['duration']:>8.2f} s {p['samples']:>8} {usage}")
+
+def profile_process(process, sampler, interval, sink=None, ring_size=1000, phases=None, devices=()):
+    """Sample `process` through `sampler` every `interval` seconds until it exits.
+
+    Memory use is constant in the run length: aggregate samples are streamed to `sink`
+    (if given), only the last `ring_size` are kept in memory, and percentiles come from
+    streaming estimators. With a PhaseTracker in `phases`, each sample is also counted
+    towards the phases the program has marked as active. Device samplers in `devices`
+    (see DEVICE_SAMPLERS) are sampled on the same timeline.
+
+    Returns a dict with the aggregate and per-process statistics. CPU is in percent of
+    the whole machine and memory in bytes.
+    """
     peak_cpu = 0
     peak_memory = 0
-    cpu_usage_list = []
-    memory_factor = 1  # Default is MB
-    if memory_unit == 'GB':
-        memory_factor = 1024  # Convert MB to GB
+    num_samples = 0
+    cpu_sum = 0
+    memory_sum = 0
+    cpu_quantiles = StreamingQuantiles()
+    memory_quantiles = StreamingQuantiles()
+    recent = deque(maxlen=ring_size)
+    proc_stats = {}
+    extended = ExtendedStats() if getattr(sampler, 'extended', False) else None
+    device_stats = {field: {'samples': 0, 'sum': 0, 'peak': 0} for d in devices for field in d.fields}
+    late_samples = 0
+
+    start_time = time.perf_counter()
+    next_time = start_time
+    while True:
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            # Wait on the process rather than sleeping so the run's end time is exact
+            try:
+                process.wait(timeout=delay)
+            except subprocess.TimeoutExpired:
+                pass
+
+        sample_start = time.perf_counter()
+        if phases:
+            phases.poll(None if sampler.tree else {process.pid})
+        samples = sampler.sample()
+
+        cpu_usage = 0
+        memory_usage = 0
+        for s in samples:
+            cpu_usage += s['cpu']
+            memory_usage += s['rss']
+
+            ps = proc_stats.setdefault(s['pid'], {'name': s['name'], 'samples': 0, 'cpu_sum': 0, 'memory_sum': 0,
+                                                  'peak_cpu': 0, 'peak_memory': 0})
+            ps['samples'] += 1
+            ps['cpu_sum'] += s['cpu']
+            ps['memory_sum'] += s['rss']
+            ps['peak_cpu'] = max(ps['peak_cpu'], s['cpu'])
+            ps['peak_memory'] = max(ps['peak_memory'], s['rss'])
+
+        # Update peak CPU and memory usage
+        if samples:
+            num_samples += 1
+            cpu_sum += cpu_usage
+            memory_sum += memory_usage
+            cpu_quantiles.add(cpu_usage)
+            memory_quantiles.add(memory_usage)
+            row = {'time': round(sample_start - start_time, 6), 'cpu': round(cpu_usage, 3),
+                   'rss': memory_usage, 'processes': len(samples)}
+            if extended:
+                row.update(extended.update(samples, sample_start))
+            for device in devices:
+                for field, value in device.sample().items():
+                    row[field] = value
+                    if value is not None:
+                        ds = device_stats[field]
+                        ds['samples'] += 1
+                        ds['sum'] += value
+                        ds['peak'] = max(ds['peak'], value)
+            if phases:
+                phases.attribute(cpu_usage, memory_usage)
+                row['phase'] = '+'.join(phases.active_phases())
+            recent.append(row)
+            if sink:
+                sink.write(row)
+
+        if cpu_usage > peak_cpu:
+            peak_cpu = cpu_usage
+
+        if memory_usage > peak_memory:
+            peak_memory = memory_usage
+
+        # Check if the process has terminated
+        if process.poll() is not None:
+            break
+
+        # If sampling could not keep up, restart the schedule instead of catching up, and
+        # idle at least as long as the sample took to bound the profiler's own CPU use
+        now = time.perf_counter()
+        if now > next_time + interval:
+            late_samples += 1
+            next_time = now + max(0, (now - sample_start) - interval)
+
+    return {
+        'duration': time.perf_counter() - start_time,
+        'peak_cpu': peak_cpu,
+        'average_cpu': cpu_sum / num_samples if num_samples else 0,
+        'cpu_percentiles': cpu_quantiles.values(),
+        'peak_memory': peak_memory,
+        'average_memory': memory_sum / num_samples if num_samples else 0,
+        'memory_percentiles': memory_quantiles.values(),
+        'samples': num_samples,
+        'late_samples': late_samples,
+        'recent': list(recent),
+        'proc_stats': proc_stats,
+        'extended': extended.summary() if extended else None,
+        'phases': phases.summary() if phases else None,
+        'devices': device_stats,
+    }
+
+def run_program(program_args, engine='psutil', interval=1, tree=False, extended=False,
+                env=None, sink=None, ring_size=1000, phases=None, devices=(), cpus=None):
+    """Start `program_args` and profile it until it exits.
 
-    start_time = time.time()
+    With `cpus`, the program (and everything it starts) is pinned to that CPU set.
+    Returns the profile_process() stats plus 'wall_time' (from start to exit) and 'returncode'.
+    """
+    preexec_fn = (lambda: os.sched_setaffinity(0, cpus)) if cpus else None
+    start_time = time.perf_counter()
+    process = subprocess.Popen(program_args, env=env, preexec_fn=preexec_fn)
+    # The child is not reaped before the sampler sees it, so this works even for instant exits
+    sampler = SAMPLERS[engine](process.pid, tree, extended)
     try:
-        while True:
-            # Get process info
-            p = psutil.Process(process.pid)
+        stats = profile_process(process, sampler, interval, sink, ring_size, phases, devices)
+    finally:
+        sampler.close()
+    stats['wall_time'] = time.perf_counter() - start_time
+    stats['returncode'] = process.returncode
+    return stats
 
-            # Update peak CPU and memory usage
-            cpu_usage = p.cpu_percent(interval=interval) / psutil.cpu_count()
-            memory_usage = p.memory_info().rss / (1024 * 1024 * memory_factor)  # Convert to MB or GB
+def print_device_stats(device_stats):
+    """Print average and peak of every device field sampled during the run."""
+    units = {'busy': '%', 'freq': 'MHz', 'mem': 'MB'}
+    print("\nDevice usage:")
+    for field, ds in device_stats.items():
+        unit = units[field.split('_')[1]]
+        factor = 1024 * 1024 if unit == 'MB' else 1
+        if ds['samples']:
+            print(f"  {field:<10} avg {ds['sum'] / ds['samples'] / factor:>9.2f} {unit:<3} "
+                  f"peak {ds['peak'] / factor:>9.2f} {unit}")
+        else:
+            print(f"  {field:<10} not available")
 
-            cpu_usage_list.append(cpu_usage)
-            
-            if cpu_usage > peak_cpu:
-                peak_cpu = cpu_usage
+def print_process_table(proc_stats, memory_unit, memory_factor):
+    """Print per-process peak/average CPU and memory for a --tree run."""
+    print(f"\nPer-process usage ({len(proc_stats)} processes seen):")
+    print(f"{'PID':>8} {'Name':<20} {'Samples':>8} {'Peak CPU':>9} {'Avg CPU':>9} {'Peak Mem':>12} {'Avg Mem':>12}")
+    print("-" * 84)
+    for pid, s in sorted(proc_stats.items()):
+        avg_cpu = s['cpu_sum'] / s['samples']
+        avg_memory = s['memory_sum'] / s['samples'] / memory_factor
+        peak_memory = s['peak_memory'] / memory_factor
+        print(f"{pid:>8} {s['name'][:20]:<20} {s['samples']:>8} {s['peak_cpu']:>8.2f}% {avg_cpu:>8.2f}% "
+              f"{peak_memory:>9.2f} {memory_unit} {avg_memory:>9.2f} {memory_unit}")
 
-            if memory_usage > peak_memory:
-                peak_memory = memory_usage
+def print_timeline(recent, memory_unit, memory_factor, rows=20):
+    """Print the in-memory ring buffer of recent samples, downsampled to at most `rows` lines."""
+    if not recent:
+        return
+    step = max(1, len(recent) // rows)
+    print(f"\nTimeline (last {len(recent)} samples, every {step}):")
+    print(f"{'Time':>10} {'CPU':>9} {'Memory':>14} {'Procs':>6}")
+    print("-" * 42)
+    for row in recent[::step]:
+        print(f"{row['time']:>8.2f} s {row['cpu']:>8.2f}% {row['rss'] / memory_factor:>11.2f} {memory_unit} {row['processes']:>6}")
 
-            # Check if the process has terminated
-            if process.poll() is not None:
-                break
-    except psutil.NoSuchProcess:
-        pass
+def format_percentiles(percentiles, factor=1, unit='%'):
+    sep = '' if unit == '%' else ' '
+    return ', '.join(f"p{p} {v / factor:.2f}{sep}{unit}" for p, v in percentiles.items())
+
+def monitor_program(program, memory_unit='MB', interval=1, tree=False, engine='psutil',
+                    output=None, output_format=None, ring_size=1000, timeline=False, extended=False,
+                    devices=(), sysfs_root='/sys'):
+    # Split the program string into arguments
+    program_args = shlex.split(program)
 
-    end_time = time.time()
-    total_duration = end_time - start_time
-    average_cpu = sum(cpu_usage_list) / len(cpu_usage_list) if cpu_usage_list else 0
+    # Listen for phase markers from the program (see profiler_phases.py)
+    phases = PhaseTracker() if hasattr(os, 'mkfifo') else None
+
+    sink = SampleSink(output, output_format) if output else None
+    device_samplers = [DEVICE_SAMPLERS[d](sysfs_root) for d in devices]
+    for d in device_samplers:
+        print(d.describe())
+
+    memory_factor = 1024 * 1024  # Default is MB
+    if memory_unit == 'GB':
+        memory_factor *= 1024  # Convert MB to GB
+
+    # Start the program and profile it until it exits
+    try:
+        stats = run_program(program_args, engine, interval, tree, extended,
+                            phases.env() if phases else None, sink, ring_size, phases, device_samplers)
+    finally:
+        if sink:
+            sink.close()
+        for d in device_samplers:
+            d.close()
+        if phases:
+            phases.close()
 
     # Output the peak usage and other statistics
     print(f"\nFinished profiling: {program}")
-    print(f"Profiling interval: {interval} sec")
-    print(f"Total Duration: {total_duration:.2f} sec")
-    print(f"Peak CPU Usage: {peak_cpu:.2f}%")
-    print(f"Average CPU Usage: {average_cpu:.2f}%")
-    print(f"Peak Memory Usage: {peak_memory:.2f} {memory_unit}")
+    print(f"Profiling interval: {interval} sec ({engine} engine, {stats['samples']} samples, {stats['late_samples']} late)")
+    print(f"Total Duration: {stats['duration']:.2f} sec")
+    if tree:
+        print(f"Processes seen: {len(stats['proc_stats'])} (aggregate over the whole process tree)")
+    print(f"Peak CPU Usage: {stats['peak_cpu']:.2f}%")
+    print(f"Average CPU Usage: {stats['average_cpu']:.2f}%")
+    print(f"CPU Usage Percentiles: {format_percentiles(stats['cpu_percentiles'])}")
+    print(f"Peak Memory Usage: {stats['peak_memory'] / memory_factor:.2f} {memory_unit}")
+    print(f"Average Memory Usage: {stats['average_memory'] / memory_factor:.2f} {memory_unit}")
+    print(f"Memory Usage Percentiles: {format_percentiles(stats['memory_percentiles'], memory_factor, memory_unit)}")
+    if sink:
+        print(f"Samples written to: {output}")
+    if device_samplers:
+        print_device_stats(stats['devices'])
+    if tree:
+        print_process_table(stats['proc_stats'], memory_unit, memory_factor)
+    if stats['phases']:
+        print_phase_table(stats['phases'], memory_unit, memory_factor)
+    if extended:
+        print_extended(stats, memory_unit, memory_factor, os.cpu_count())
+    if timeline:
+        print_timeline(stats['recent'], memory_unit, memory_factor)
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if not n:
+        return 0
+    return values[n // 2] if n % 2 else (values[n // 2 - 1] + values[n // 2]) / 2
+
+def median_ci(values, confidence=0.95):
+    """Distribution-free confidence interval for the median from order statistics.
+
+    Picks the narrowest symmetric pair of order statistics whose binomial coverage is at
+    least `confidence`. With too few values for that coverage the full range is returned.
+    """
+    values = sorted(values)
+    n = len(values)
+    if not n:
+        return 0, 0
+    # With B ~ Binomial(n, 0.5) values below the median, the coverage of
+    # [values[k], values[n - 1 - k]] is 1 - 2 * P(B <= k)
+    cdf = 0
+    lower = 0
+    for k in range(n // 2):
+        cdf += math.comb(n, k) / 2 ** n
+        if 1 - 2 * cdf < confidence:
+            break
+        lower = k
+    return values[lower], values[n - 1 - lower]
+
+def mann_whitney_u(a, b):
+    """Two-sided Mann-Whitney U test (normal approximation with tie correction). Returns (U, p-value)."""
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 0, 1
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0] * len(combined)
+    tie_term = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        # Tied values share the average of their ranks
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        tie_term += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    rank_sum_a = sum(r for r, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum_a - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return u, 1
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return u, min(1, math.erfc(max(z, 0) / math.sqrt(2)))
+
+def compare_programs(programs, rounds=10, memory_unit='MB', interval=0.1, tree=False, engine='psutil',
+                     seed=None, output=None, output_format=None, alpha=0.05):
+    """Run several programs for `rounds` rounds in randomized interleaved order and compare them.
+
+    Shuffling the order in every round spreads thermal, turbo and page-cache drift evenly
+    over the programs instead of letting it favour whichever runs first. The first program
+    is the baseline; each other program is tested against it with Mann-Whitney U.
+    """
+    memory_factor = 1024 * 1024 * (1024 if memory_unit == 'GB' else 1)
+    metrics = [
+        ('wall_time', 'Duration', 1, 's'),
+        ('peak_memory', 'Peak Memory', memory_factor, memory_unit),
+        ('average_cpu', 'Average CPU', 1, '%'),
+        ('peak_cpu', 'Peak CPU', 1, '%'),
+    ]
+    rng = random.Random(seed)
+    sink = SampleSink(output, output_format) if output else None
+    results = [{key: [] for key, _, _, _ in metrics} for _ in programs]
+    failures = [0] * len(programs)
+
+    try:
+        for r in range(rounds):
+            order = list(range(len(programs)))
+            rng.shuffle(order)
+            for i in order:
+                stats = run_program(shlex.split(programs[i]), engine, interval, tree)
+                # Failed runs are counted but kept out of the statistics: a crash is not a fast run
+                if stats['returncode'] != 0:
+                    failures[i] += 1
+                else:
+                    for key, _, _, _ in metrics:
+                        results[i][key].append(stats[key])
+                print(f"Round {r + 1}/{rounds} [{chr(ord('A') + i)}] {stats['wall_time']:.3f} sec, "
+                      f"peak {stats['peak_memory'] / memory_factor:.2f} {memory_unit}, avg CPU {stats['average_cpu']:.2f}%"
+                      + (f", exit code {stats['returncode']}" if stats['returncode'] else ""))
+                if sink:
+                    sink.write({'round': r + 1, 'program': chr(ord('A') + i), 'command': programs[i],
+                                'returncode': stats['returncode'], **{key: stats[key] for key, _, _, _ in metrics}})
+    finally:
+        if sink:
+            sink.close()
+
+    print(f"\nCompared {len(programs)} programs over {rounds} interleaved rounds:")
+    for i, program in enumerate(programs):
+        failed = f" ({failures[i]} failed runs, left out of the statistics)" if failures[i] else ""
+        print(f"  [{chr(ord('A') + i)}] {program}{failed}")
+
+    for key, title, factor, unit in metrics:
+        print(f"\n{title} (median, 95% CI; vs A: median ratio, Mann-Whitney p):")
+        base = results[0][key]
+        for i in range(len(programs)):
+            values = [v / factor for v in results[i][key]]
+            if not values:
+                print(f"  [{chr(ord('A') + i)}] no successful runs")
+                continue
+            lo, hi = median_ci(values)
+            line = f"  [{chr(ord('A') + i)}] {median(values):>10.3f} {unit:<3} [{lo:.3f}, {hi:.3f}]"
+            if i > 0 and base:
+                base_median = median(base) / factor
+                ratio = f"{median(values) / base_median:>6.3f}x" if base_median else f"{'-':>7}"
+                _, p = mann_whitney_u(base, results[i][key])
+                verdict = 'significant' if p < alpha else 'not significant'
+                line += f"  {ratio}  p={p:.4f} ({verdict})"
+            print(line)
+    successful = min((rounds - f for f in failures if f < rounds), default=0)
+    if 0 < successful < 6:
+        print(f"\nNote: with {successful} successful runs the confidence intervals span the full range; use 6 or more.")
+
+def parse_cpu_list(text):
+    """Parse a sysfs CPU list such as '0-3,8-11' into a list of ints."""
+    cpus = []
+    for part in text.strip().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def format_cpu_list(cpus):
+    """Format a list of CPUs as a compact sysfs-style list such as '0-3,8-11'."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{a}-{b}" if a != b else f"{a}" for a, b in ranges)
+
+def read_cpu_topology(sysfs_root='/sys'):
+    """Return the usable physical cores as {(socket, core_id): [logical cpus]}, sorted socket by socket."""
+    cores = {}
+    for cpu in sorted(os.sched_getaffinity(0)):
+        topology = os.path.join(sysfs_root, 'devices', 'system', 'cpu', f'cpu{cpu}', 'topology')
+        try:
+            with open(os.path.join(topology, 'physical_package_id')) as f:
+                socket = int(f.read())
+            with open(os.path.join(topology, 'core_id')) as f:
+                core = int(f.read())
+        except (OSError, ValueError):
+            socket, core = 0, cpu
+        cores.setdefault((socket, core), []).append(cpu)
+    return dict(sorted(cores.items()))
+
+def read_numa_nodes(sysfs_root='/sys'):
+    """Return {node: [cpus]} from sysfs, or {} on systems without NUMA information."""
+    node_dir = os.path.join(sysfs_root, 'devices', 'system', 'node')
+    nodes = {}
+    if os.path.isdir(node_dir):
+        for name in os.listdir(node_dir):
+            if re.fullmatch(r'node\d+', name):
+                with open(os.path.join(node_dir, name, 'cpulist')) as f:
+                    nodes[int(name[4:])] = parse_cpu_list(f.read())
+    return dict(sorted(nodes.items()))
+
+def build_sweep_points(cores, smt='both'):
+    """Return the CPU sets of a scaling sweep as dicts with 'name', 'cores' and 'cpus'.
+
+    Core counts go 1, 2, 4, ... up to all cores, filling one socket before the next, each
+    with only the first hardware thread of every core (SMT off) and/or all of its
+    siblings (SMT on). On multi-socket hosts every single socket is added as well.
+    """
+    core_list = list(cores.items())
+    counts = []
+    n = 1
+    while n < len(core_list):
+        counts.append(n)
+        n *= 2
+    counts.append(len(core_list))
+
+    has_smt = any(len(siblings) > 1 for siblings in cores.values())
+    variants = [v for v in ('off', 'on') if smt in (v, 'both') and (v == 'off' or has_smt)]
+
+    groups = [(f"{n}c", core_list[:n]) for n in counts]
+    sockets = sorted({socket for socket, _ in cores})
+    if len(sockets) > 1:
+        for socket in sockets:
+            groups.append((f"socket{socket}", [c for c in core_list if c[0][0] == socket]))
+
+    points = []
+    for name, group in groups:
+        for variant in variants:
+            cpus = [cpu for _, siblings in group for cpu in (siblings if variant == 'on' else siblings[:1])]
+            points.append({'name': name + ('+smt' if variant == 'on' else ''), 'cores': len(group), 'cpus': cpus})
+    return points
+
+def numa_prefix(policy, cpus, nodes):
+    """Return the numactl arguments for a memory policy, or [] for the default policy."""
+    if policy == 'none':
+        return []
+    if policy == 'local':
+        return ['numactl', '--localalloc']
+    if policy == 'interleave':
+        return ['numactl', '--interleave=all']
+    # bind: only allocate on the nodes that host the CPU set
+    bind_nodes = [node for node, node_cpus in nodes.items() if set(node_cpus) & set(cpus)] or [0]
+    return ['numactl', f"--membind={','.join(map(str, bind_nodes))}"]
+
+def sweep_program(program, rounds=1, memory_unit='MB', interval=0.1, tree=True, engine='psutil',
+                  smt='both', numa_policies=('none',), set_threads=False, seed=None,
+                  output=None, output_format=None, sysfs_root='/sys'):
+    """Run `program` under a sweep of CPU sets and NUMA memory policies and report scaling.
+
+    Every point is run `rounds` times in randomized interleaved order and summarized by
+    its median. Speedup and parallel efficiency are relative to the first (1 core, SMT
+    off) point of the same memory policy; efficiency is per physical core.
+    """
+    cores = read_cpu_topology(sysfs_root)
+    nodes = read_numa_nodes(sysfs_root)
+    if any(policy != 'none' for policy in numa_policies) and not shutil.which('numactl'):
+        raise SystemExit("NUMA memory policies need numactl (apt install numactl)")
+
+    memory_factor = 1024 * 1024 * (1024 if memory_unit == 'GB' else 1)
+    sockets = len({socket for socket, _ in cores})
+    print(f"Topology: {sum(len(s) for s in cores.values())} CPUs, {len(cores)} cores, "
+          f"{sockets} sockets, {len(nodes) or 1} NUMA nodes")
+
+    points = [dict(p, policy=policy) for policy in numa_policies for p in build_sweep_points(cores, smt)]
+    results = [{'wall_time': [], 'average_cpu': [], 'peak_memory': [], 'failures': 0} for _ in points]
+    rng = random.Random(seed)
+    sink = SampleSink(output, output_format) if output else None
+    try:
+        for r in range(rounds):
+            order = list(range(len(points)))
+            rng.shuffle(order)
+            for i in order:
+                point = points[i]
+                env = None
+                if set_threads:
+                    # Frameworks size their thread pools from the core count, not the affinity mask
+                    env = dict(os.environ, OMP_NUM_THREADS=str(len(point['cpus'])))
+                program_args = numa_prefix(point['policy'], point['cpus'], nodes) + shlex.split(program)
+                stats = run_program(program_args, engine, interval, tree, env=env, cpus=point['cpus'])
+                res = results[i]
+                # Failed runs are counted but kept out of the medians
+                if stats['returncode'] != 0:
+                    res['failures'] += 1
+                else:
+                    for key in ('wall_time', 'average_cpu', 'peak_memory'):
+                        res[key].append(stats[key])
+                print(f"Round {r + 1}/{rounds} {point['name']:<14} {point['policy']:<10} {stats['wall_time']:.3f} sec"
+                      + (f", exit code {stats['returncode']}" if stats['returncode'] else ""))
+                if sink:
+                    sink.write({'round': r + 1, 'point': point['name'], 'policy': point['policy'],
+                                'cpus': format_cpu_list(point['cpus']), 'cores': point['cores'],
+                                'returncode': stats['returncode'], 'wall_time': stats['wall_time'],
+                                'average_cpu': stats['average_cpu'], 'peak_memory': stats['peak_memory']})
+    finally:
+        if sink:
+            sink.close()
+
+    num_cpus = os.cpu_count()
+    print(f"\nScaling of: {program} (median of the successful runs out of {rounds} rounds)")
+    print(f"{'Point':<14} {'Policy':<10} {'CPUs':>5} {'Cores':>5} {'Duration':>10} {'Speedup':>8} "
+          f"{'Efficiency':>10} {'CPU used':>9} {'Peak Mem':>12}")
+    print("-" * 93)
+    baselines = {}
+    for point, res in zip(points, results):
+        if not res['wall_time']:
+            print(f"{point['name']:<14} {point['policy']:<10} {len(point['cpus']):>5} {point['cores']:>5} "
+                  f"  all {res['failures']} runs failed")
+            continue
+        duration = median(res['wall_time'])
+        base = baselines.setdefault(point['policy'], (duration, point['cores']))
+        speedup = base[0] / duration if duration else 0
+        efficiency = speedup / (point['cores'] / base[1]) * 100
+        cores_used = median(res['average_cpu']) * num_cpus / 100
+        failed = f" ({res['failures']} failed)" if res['failures'] else ""
+        print(f"{point['name']:<14} {point['policy']:<10} {len(point['cpus']):>5} {point['cores']:>5} "
+              f"{duration:>8.3f} s {speedup:>7.2f}x {efficiency:>9.1f}% {cores_used:>9.2f} "
+              f"{median(res['peak_memory']) / memory_factor:>9.2f} {memory_unit}{failed}")
+
+def benchmark_overhead(intervals, duration=3, engine='psutil', tree=False, program=None):
+    """Measure the profiler's own CPU cost while sampling a target at each interval.
+
+    The target is `program` if given, otherwise an idle `sleep`, so the numbers are the
+    cost of sampling alone. Overhead is reported in percent of one core.
+    """
+    print(f"\nProfiler overhead ({engine} engine{', tree' if tree else ''}, {duration} sec per interval):")
+    print(f"{'Interval':>10} {'Samples':>8} {'Rate':>10} {'Late':>6} {'Cost/sample':>12} {'Overhead':>10}")
+    print("-" * 62)
+    for interval in intervals:
+        program_args = shlex.split(program) if program else ['sleep', str(duration)]
+        process = subprocess.Popen(program_args)
+        sampler = SAMPLERS[engine](process.pid, tree)
+
+        cpu_start = time.process_time()
+        try:
+            stats = profile_process(process, sampler, interval)
+        finally:
+            sampler.close()
+        cpu_time = time.process_time() - cpu_start
+
+        rate = stats['samples'] / stats['duration']
+        cost_us = cpu_time / stats['samples'] * 1e6 if stats['samples'] else 0
+        overhead = cpu_time / stats['duration'] * 100
+        print(f"{interval * 1000:>8.1f}ms {stats['samples']:>8} {rate:>7.0f}/s {stats['late_samples']:>6} "
+              f"{cost_us:>9.1f} us {overhead:>9.2f}%")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Monitor peak CPU and memory usage of a program.')
-    parser.add_argument('-p', '--program', required=True, help='The program to run and monitor, including any arguments, enclosed in quotes.')
+    parser.add_argument('-p', '--program', help='The program to run and monitor, including any arguments, enclosed in quotes.')
+    parser.add_argument('-c', '--compare', nargs='+', metavar='PROGRAM', help='Compare two or more programs (each enclosed in quotes) over --rounds interleaved runs. The first one is the baseline.')
+    parser.add_argument('-r', '--rounds', type=int, help='Number of rounds for --compare (default 10) or --sweep (default 1).')
+    parser.add_argument('--seed', type=int, help='Random seed for the run order of --compare and --sweep.')
+    parser.add_argument('--sweep', action='store_true', help='Run -p under a sweep of CPU sets (1, 2, 4 ... N cores, per socket, SMT off/on) and report speedup and parallel efficiency.')
+    parser.add_argument('--sweep-smt', choices=['off', 'on', 'both'], default='both', help='Use only the first hardware thread of each core (off), all siblings (on), or both. Default is both.')
+    parser.add_argument('--sweep-numa', nargs='+', choices=['none', 'local', 'interleave', 'bind'], default=['none'], help='NUMA memory policies to sweep (via numactl). "bind" binds memory to the nodes of the CPU set. Default is none.')
+    parser.add_argument('--sweep-set-threads', action='store_true', help='Set OMP_NUM_THREADS to the size of the CPU set for each point.')
     parser.add_argument('-m', '--memory-unit', choices=['MB', 'GB'], default='MB', help='The unit for memory usage (MB or GB). Default is MB.')
     parser.add_argument('-i', '--interval', type=float, default=1, help='The interval in seconds for measuring CPU and memory usage. Default is 1 second.')
+    parser.add_argument('-t', '--tree', action='store_true', help='Also monitor all child and grandchild processes and report aggregate and per-process usage.')
+    parser.add_argument('-e', '--engine', choices=list(SAMPLERS), default='psutil', help='Sampling engine. "proc" re-reads open /proc files and supports intervals down to ~1 ms (Linux only). Default is psutil.')
+    parser.add_argument('-x', '--extended', action='store_true', help='Also collect USS/PSS/swap, page faults, context switches, per-thread CPU and I/O bytes, and report the likely bottleneck. Costs more per sample.')
+    parser.add_argument('-d', '--devices', nargs='+', choices=list(DEVICE_SAMPLERS), default=[], help='Also sample Intel GPU and/or NPU busy %% and frequency from sysfs on the same timeline.')
+    parser.add_argument('--sysfs-root', default='/sys', help='Root of the sysfs tree for --devices and --sweep, e.g. a fake tree for testing. Default is /sys.')
+    parser.add_argument('-o', '--output', help='Stream every sample to this file as it is taken (.csv or .jsonl).')
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'], help='Format of --output. Default is taken from the file extension, falling back to csv.')
+    parser.add_argument('--ring-size', type=int, default=1000, help='Number of recent samples kept in memory. Default is 1000.')
+    parser.add_argument('--timeline', action='store_true', help='Print the recent samples kept in memory at the end of the run.')
+    parser.add_argument('--bench-overhead', action='store_true', help="Measure the profiler's own CPU cost at each of --bench-intervals instead of profiling a program.")
+    parser.add_argument('--bench-intervals', type=float, nargs='+', default=[0.001, 0.002, 0.005, 0.01, 0.1], help='Intervals in seconds for --bench-overhead.')
+    parser.add_argument('--bench-duration', type=float, default=3, help='Seconds to sample at each interval for --bench-overhead. Default is 3.')
 
     args = parser.parse_args()
 
-    monitor_program(args.program, args.memory_unit, args.interval)
-
+    if args.compare:
+        if len(args.compare) < 2:
+            parser.error('--compare needs at least two programs')
+        compare_programs(args.compare, args.rounds or 10, args.memory_unit, args.interval, args.tree, args.engine,
+                         args.seed, args.output, args.output_format)
+    elif args.sweep:
+        if not args.program:
+            parser.error('--sweep needs -p/--program')
+        sweep_program(args.program, args.rounds or 1, args.memory_unit, args.interval, args.tree, args.engine,
+                      args.sweep_smt, args.sweep_numa, args.sweep_set_threads, args.seed,
+                      args.output, args.output_format, args.sysfs_root)
+    elif args.bench_overhead:
+        benchmark_overhead(args.bench_intervals, args.bench_duration, args.engine, args.tree, args.program)
+    elif args.program:
+        monitor_program(args.program, args.memory_unit, args.interval, args.tree, args.engine,
+                        args.output, args.output_format, args.ring_size, args.timeline, args.extended,
+                        args.devices, args.sysfs_root)
+    else:
+        parser.error('one of -p/--program, -c/--compare or --bench-overhead is required')
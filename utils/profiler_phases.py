@@ -0,0 +1,63 @@
+'''
+Phase markers for cpu-mem-profiler.py.
+
+A program run under cpu-mem-profiler.py can mark the phases it goes through, and the
+profiler reports duration, peak memory and average CPU per phase:
+
+    from profiler_phases import phase
+
+    with phase("compile"):
+        pipe = ov_genai.LLMPipeline(model_path, "CPU")
+    with phase("generate"):
+        pipe.generate(prompt)
+
+cpu-mem-profiler.py puts this directory on PYTHONPATH and the path of a FIFO in
+CPU_MEM_PROFILER_PHASES. When the program is not run under the profiler, the markers do
+nothing, so they can stay in the benchmark scripts.
+
+Each marker is one JSON line of less than PIPE_BUF bytes, so markers written by several
+processes of the same tree are not interleaved.
+'''
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+PHASES_ENV = 'CPU_MEM_PROFILER_PHASES'
+
+_fd = None
+
+def _get_fd():
+    global _fd
+    if _fd is None:
+        path = os.environ.get(PHASES_ENV)
+        if not path:
+            return None
+        try:
+            _fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            # No profiler is reading the FIFO
+            return None
+    return _fd
+
+def mark(event, name):
+    """Send a 'begin' or 'end' marker for phase `name` to the profiler, if there is one."""
+    fd = _get_fd()
+    if fd is None:
+        return
+    line = json.dumps({'event': event, 'phase': name, 'pid': os.getpid(), 'time': time.time()}) + '\n'
+    try:
+        os.write(fd, line.encode())
+    except OSError:
+        # The profiler went away or the FIFO is full; markers must never break the program
+        pass
+
+@contextmanager
+def phase(name):
+    """Mark the enclosed block as phase `name`. Phases may nest and repeat."""
+    mark('begin', name)
+    try:
+        yield
+    finally:
+        mark('end', name)